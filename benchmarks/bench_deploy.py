@@ -0,0 +1,132 @@
+"""
+End-to-end deployment benchmark against the local Fabric mock.
+
+For every size N, a synthetic repo with N lakehouses and N notebooks (plus the
+z_default_lakehouse) is deployed into an empty target workspace and then
+deployed again without changes. For both runs the wall time, the number of api
+requests and the peak memory of the deploying process are reported.
+
+Every deployment runs in its own process so that its peak memory is not mixed
+up with the mock server.
+
+Runs with
+    poetry run python benchmarks/bench_deploy.py
+    poetry run python benchmarks/bench_deploy.py --sizes 10 100 500 --latency 0.05 --throttle-rate 0.05
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from benchmarks.fabric_mock import FabricMock
+
+
+def make_repo(root: Path, size, source_workspace_id, default_lakehouse_id, cells=20):
+    """
+    Writes a repo with the z_default_lakehouse, size lakehouses and size notebooks
+    that reference the source workspace and its default lakehouse.
+    """
+    def item(name, item_type):
+        folder = root / f"{name}.{item_type}"
+        folder.mkdir(parents=True)
+        with open(folder / ".platform", "w") as f:
+            json.dump({"metadata": {"type": item_type, "displayName": name}}, f)
+        return folder
+
+    item("z_default_lakehouse", "Lakehouse")
+    for i in range(size):
+        item(f"lakehouse_{i}", "Lakehouse")
+        lines = ["# Fabric notebook source", "# METADATA ********************", "# META {",
+                 f'# META   "default_lakehouse": "{default_lakehouse_id}",',
+                 f'# META   "default_lakehouse_workspace_id": "{source_workspace_id}"', "# META }"]
+        for cell in range(cells):
+            lines += ["# CELL ********************", f"df = spark.read.table('table_{i}_{cell}')",
+                      f"df.write.mode('overwrite').saveAsTable('result_{i}_{cell}')"]
+        (item(f"notebook_{i}", "Notebook") / "notebook-content.py").write_text("\n".join(lines) + "\n")
+
+
+def deploy(url, source_workspace_id, target_workspace_id, repo, max_workers):
+    """
+    Deploys repo in this process and prints the result as json on the last line.
+    """
+    from deployment.config import Target
+    from deployment.run import Runner
+    from helpers.fabric import FabricClient
+
+    # stand-in for Config, which would read config/deploy.toml and sign in
+    config = SimpleNamespace(
+        targets=[Target("benchmark", target_workspace_id, max_workers)],
+        source_workspace_id=source_workspace_id, target_workspace_id=target_workspace_id,
+        repo_remote_url=f"benchmark:{repo}", repo_local_path=Path(repo), item_root="",
+        max_workers=max_workers, client=FabricClient({}, base_url=url, pool_size=max_workers))
+    start = time.perf_counter()
+    runner = Runner(config)
+    runner.compute_plan()
+    succeeded = runner.execute()
+    elapsed = time.perf_counter() - start
+    # kilobytes on linux, bytes on macos
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    limits = {s["class"]: s["limit"] for s in config.client.controller.stats() if s["requests"]}
+    print(json.dumps({"seconds": elapsed, "succeeded": succeeded, "peak_mb": peak_mb, "retries": config.client.retries, "limits": limits}))
+
+
+def run_child(mock, source_workspace_id, target_workspace_id, repo, workdir, max_workers):
+    requests_before, throttled_before = mock.request_count, mock.throttled
+    output = subprocess.run([sys.executable, __file__, "--child", mock.url, source_workspace_id, target_workspace_id, str(repo), str(max_workers)],
+                            cwd=workdir, check=True, capture_output=True, text=True).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["requests"] = mock.request_count - requests_before
+    result["throttled"] = mock.throttled - throttled_before
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="numbers of lakehouses and notebooks")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="share of requests answered with 429")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="share of requests answered with 500")
+    parser.add_argument("--capacity", type=int, help="requests in flight beyond which the mock answers with 429")
+    parser.add_argument("--child", nargs=5, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        url, source_workspace_id, target_workspace_id, repo, max_workers = args.child
+        deploy(url, source_workspace_id, target_workspace_id, repo, int(max_workers))
+        return
+
+    print(f"latency {args.latency * 1000:.0f} ms, page size {args.page_size}, throttle rate {args.throttle_rate}, "
+          f"failure rate {args.failure_rate}, capacity {args.capacity or 'unlimited'}, {args.workers} workers\n")
+    print(f"{'N':>6}  {'run':<9} {'seconds':>8} {'requests':>9} {'throttled':>10} {'retries':>8} {'peak MB':>8}  ok   final limits")
+    for size in args.sizes:
+        mock = FabricMock(latency=args.latency, page_size=args.page_size, throttle_rate=args.throttle_rate,
+                          failure_rate=args.failure_rate, capacity=args.capacity, retry_after=0.05, lro_retry_after=0.05).start()
+        try:
+            source_workspace_id = mock.add_workspace()
+            default_lakehouse = mock.add_item(source_workspace_id, "Lakehouse", "z_default_lakehouse")
+            target_workspace_id = mock.add_workspace()
+            with tempfile.TemporaryDirectory() as workdir:
+                repo = Path(workdir) / "repo"
+                make_repo(repo, size, source_workspace_id, default_lakehouse["id"])
+                for run in ["deploy", "redeploy"]:
+                    r = run_child(mock, source_workspace_id, target_workspace_id, repo, workdir, args.workers)
+                    print(f"{size:>6}  {run:<9} {r['seconds']:>8.2f} {r['requests']:>9} {r['throttled']:>10} {r['retries']:>8} "
+                          f"{r['peak_mb']:>8.1f}  {'yes' if r['succeeded'] else 'NO ':<4} "
+                          f"{', '.join(f'{name} {limit}' for name, limit in r['limits'].items())}")
+        finally:
+            mock.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Startup benchmark of the cli.
+
+Measures the time to import main in a fresh interpreter and lists which of the
+slow dependencies are already loaded at that point. They should only be
+imported once they are needed (signing in, talking to the api, printing the plan).
+
+Runs with
+    poetry run python benchmarks/bench_startup.py
+"""
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RUNS = 10
+HEAVY_MODULES = ["requests", "azure.identity", "jwt", "anytree"]
+
+PROBE = f"""
+import sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+print(elapsed)
+print(",".join(name for name in {HEAVY_MODULES!r} if name in sys.modules))
+"""
+
+
+def measure():
+    output = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, check=True, capture_output=True, text=True).stdout.splitlines()
+    return float(output[0]), [name for name in output[1].split(",") if name]
+
+
+def main():
+    results = [measure() for _ in range(RUNS)]
+    times = [elapsed for elapsed, _ in results]
+    loaded = results[-1][1]
+    print(f"import main: median {statistics.median(times) * 1000:.1f} ms, min {min(times) * 1000:.1f} ms over {RUNS} runs")
+    print(f"slow dependencies loaded at import: {', '.join(loaded) if loaded else 'none'}")
+
+
+if __name__ == "__main__":
+    main()
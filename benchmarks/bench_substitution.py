@@ -0,0 +1,78 @@
+"""
+Micro-benchmark of the notebook id substitution.
+
+Compares the previous approach (one str.replace pass per mapping entry) with
+both search modes of IdSubstitution, the literal search and the GUID scan, on
+synthetic notebook content, once without source ids and once looking for the
+ids of 20 unmapped source workspace items as well, as the runner does (the loop
+does not report unmapped ids). The last column is the mode IdSubstitution
+picks, the crossover is LITERAL_SEARCH_MAX_IDS.
+
+Runs with
+    poetry run python benchmarks/bench_substitution.py
+"""
+import sys
+import timeit
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from deployment.substitution import IdSubstitution
+
+SOURCE_ITEMS = 20
+
+
+def replace_loop(mapping, content):
+    for ids in mapping.values():
+        for src, tgt in ids.items():
+            content = content.replace(src, tgt)
+    return content
+
+
+def make_notebook(lakehouse_ids, workspace_id, cells=200):
+    lines = []
+    for i in range(cells):
+        lakehouse_id = lakehouse_ids[i % len(lakehouse_ids)]
+        lines.append("# META {")
+        lines.append(f'# META   "default_lakehouse": "{lakehouse_id}",')
+        lines.append(f'# META   "default_lakehouse_workspace_id": "{workspace_id}"')
+        lines.append("# META }")
+        lines.append(f"df = spark.read.table('table_{i}')")
+        lines.append(f"df.write.mode('overwrite').saveAsTable('result_{i}')  # {uuid.uuid4()}")
+    return "\n".join(lines)
+
+
+def main():
+    workspace_src, workspace_tgt = str(uuid.uuid4()), str(uuid.uuid4())
+    for n_source_items in (0, SOURCE_ITEMS):
+        source_ids = [str(uuid.uuid4()) for _ in range(n_source_items)]
+        print(f"\n{n_source_items} source ids\n")
+        print(f"{'mappings':>8} {'loop (ms)':>10} {'literal (ms)':>13} {'scan (ms)':>10} {'picked':>8}")
+        for n_mappings in (1, 10, 50, 200):
+            run(n_mappings, workspace_src, workspace_tgt, source_ids)
+
+
+def run(n_mappings, workspace_src, workspace_tgt, source_ids):
+    """
+    Prints one row: the time of the loop and of both search modes for n_mappings lakehouses.
+    """
+    lakehouses = {str(uuid.uuid4()): str(uuid.uuid4()) for _ in range(n_mappings)}
+    mapping = {'workspace': {workspace_src: workspace_tgt}, 'lakehouse': lakehouses}
+    content = make_notebook(list(lakehouses), workspace_src)
+    picked = IdSubstitution(mapping, source_ids)
+    literal = IdSubstitution(mapping, source_ids)
+    literal.literal_search = True
+    scan = IdSubstitution(mapping, source_ids)
+    scan.literal_search = False
+    assert literal.apply(content).text == scan.apply(content).text == replace_loop(mapping, content)
+
+    repeat = 20
+    timings = [min(timeit.repeat(func, number=repeat, repeat=3)) / repeat * 1000
+               for func in (lambda: replace_loop(mapping, content), lambda: literal.apply(content), lambda: scan.apply(content))]
+    mode = "literal" if picked.literal_search else "scan"
+    print(f"{n_mappings:>8} {timings[0]:>10.3f} {timings[1]:>13.3f} {timings[2]:>10.3f} {mode:>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Local stand-in for the parts of the Fabric REST api this tool uses.
+
+Serves workspaces, items, lakehouses, notebooks, item definitions and the
+long-running operations behind 202 responses from memory, so helpers/fabric.py
+and the Runner can be exercised and measured without a tenant.
+
+Every request can be delayed (latency), list calls are paginated (page_size),
+and a share of the requests can be throttled with 429 (throttle_rate) or fail
+with 500 (failure_rate). With capacity set, requests beyond that many in flight
+are throttled as well, like a Fabric capacity under load. Creates of items whose display name is in fail_names
+fail for good, as does a share of the long-running operations (lro_failure_rate).
+
+    mock = FabricMock(latency=0.02, page_size=50).start()
+    mock.add_workspace("source")
+    client = FabricClient({}, base_url=mock.url)
+    ...
+    print(mock.request_count)
+    mock.stop()
+"""
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+class FabricMock:
+    def __init__(self, latency=0.0, page_size=100, throttle_rate=0.0, failure_rate=0.0, retry_after=0.1,
+                 lro_polls=1, lro_retry_after=0.1, lro_failure_rate=0.0, fail_names=(), capacity=None, seed=0):
+        self.latency = latency
+        self.capacity = capacity
+        self.in_flight = 0
+        self.page_size = page_size
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.lro_polls = lro_polls
+        self.lro_retry_after = lro_retry_after
+        self.lro_failure_rate = lro_failure_rate
+        self.fail_names = set(fail_names)
+        self.workspaces = {}
+        self.definitions = {}
+        self.operations = {}
+        self.requests = Counter()
+        self.throttled = 0
+        self.failed = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    # setup
+
+    def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(self))
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="fabric-mock", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self._server.server_port}/v1"
+
+    @property
+    def request_count(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def add_workspace(self, workspace_id=None, items=()):
+        workspace_id = workspace_id or str(uuid.uuid4())
+        self.workspaces[workspace_id] = {}
+        for item_type, display_name in items:
+            self.add_item(workspace_id, item_type, display_name)
+        return workspace_id
+
+    def add_item(self, workspace_id, item_type, display_name, definition=None):
+        item = {"id": str(uuid.uuid4()), "type": item_type, "displayName": display_name,
+                "description": "", "workspaceId": workspace_id}
+        with self._lock:
+            self.workspaces[workspace_id][item["id"]] = item
+            if definition is not None:
+                self.definitions[item["id"]] = definition
+        return item
+
+    def items(self, workspace_id, item_type=None):
+        with self._lock:
+            return [item for item in self.workspaces[workspace_id].values() if item_type in (None, item["type"])]
+
+    # request handling
+
+    def handle(self, method, url, body):
+        """
+        Returns (status, body, headers) for a request.
+        """
+        parsed = urlparse(url)
+        parts = parsed.path.strip("/").split("/")[1:]
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        with self._lock:
+            self.requests[(method, _endpoint(parts))] += 1
+            roll = self._random.random()
+            self.in_flight += 1
+            overloaded = self.capacity is not None and self.in_flight > self.capacity
+        try:
+            if self.latency:
+                time.sleep(self.latency)
+            return self._respond(method, parsed, parts, query, body, roll, overloaded)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _respond(self, method, parsed, parts, query, body, roll, overloaded):
+        if overloaded or roll < self.throttle_rate:
+            with self._lock:
+                self.throttled += 1
+            return 429, {"errorCode": "RequestBlocked", "message": "throttled by the mock"}, {"Retry-After": str(self.retry_after)}
+        if roll < self.throttle_rate + self.failure_rate:
+            with self._lock:
+                self.failed += 1
+            return 500, {"errorCode": "InternalError", "message": "failure injected by the mock"}, {}
+
+        route = (method, _endpoint(parts))
+        try:
+            if route == ("GET", "workspaces"):
+                return self._page([{"id": ws, "displayName": ws, "type": "Workspace"} for ws in self.workspaces], query, parsed.path)
+            if route == ("GET", "workspaces/items"):
+                return self._page(self.items(parts[1], query.get("type")), query, parsed.path)
+            if route == ("GET", "workspaces/lakehouses"):
+                return self._page(self.items(parts[1], "Lakehouse"), query, parsed.path)
+            if route == ("POST", "workspaces/lakehouses"):
+                return self._create(parts[1], "Lakehouse", body, lro=False)
+            if route == ("POST", "workspaces/items"):
+                return self._create(parts[1], body.get("type"), body, lro=True)
+            if route == ("POST", "workspaces/items/getDefinition"):
+                self._require(parts[1], parts[3])
+                return self._start_operation({"definition": self.definitions.get(parts[3], {"parts": []})})
+            if route == ("POST", "workspaces/items/updateDefinition"):
+                self._require(parts[1], parts[3])
+                def update():
+                    with self._lock:
+                        self.definitions[parts[3]] = body.get("definition")
+                return self._start_operation(None, on_success=update)
+            if route == ("PATCH", "workspaces/items"):
+                item = self.workspaces[parts[1]][parts[3]]
+                if any(other["displayName"] == body.get("displayName") and other["type"] == item["type"] for other in self.items(parts[1])):
+                    return 409, {"errorCode": "ItemDisplayNameAlreadyInUse", "message": f"{body.get('displayName')} already exists"}, {}
+                with self._lock:
+                    item["displayName"] = body.get("displayName", item["displayName"])
+                return 200, item, {}
+            if route in (("DELETE", "workspaces/lakehouses"), ("DELETE", "workspaces/notebooks")):
+                self._require(parts[1], parts[3])
+                with self._lock:
+                    del self.workspaces[parts[1]][parts[3]]
+                    self.definitions.pop(parts[3], None)
+                return 200, None, {}
+            if route == ("GET", "operations"):
+                return self._poll(parts[1])
+            if route == ("GET", "operations/result"):
+                return 200, self.operations[parts[1]]["result"], {}
+        except KeyError:
+            return 404, {"errorCode": "ItemNotFound", "message": f"{parsed.path} not found"}, {}
+        return 400, {"errorCode": "UnsupportedRequest", "message": f"{method} {parsed.path} is not mocked"}, {}
+
+    def _page(self, values, query, path):
+        start = int(query.get("continuationToken", 0))
+        body = {"value": values[start:start + self.page_size]}
+        if start + self.page_size < len(values):
+            token = str(start + self.page_size)
+            body["continuationToken"] = token
+            body["continuationUri"] = f"{self.url}{path[len('/v1'):]}?{urlencode({**query, 'continuationToken': token})}"
+        return 200, body, {}
+
+    def _require(self, workspace_id, item_id):
+        self.workspaces[workspace_id][item_id]
+
+    def _create(self, workspace_id, item_type, body, lro):
+        display_name = body.get("displayName")
+        if workspace_id not in self.workspaces:
+            raise KeyError(workspace_id)
+        if display_name in self.fail_names:
+            return 400, {"errorCode": "InvalidItem", "message": f"creation of {display_name} failed in the mock"}, {}
+        if any(item["displayName"] == display_name and item["type"] == item_type for item in self.items(workspace_id)):
+            return 409, {"errorCode": "ItemDisplayNameAlreadyInUse", "message": f"{display_name} already exists"}, {}
+        if not lro:
+            return 201, self.add_item(workspace_id, item_type, display_name), {}
+        created = {}
+        def finish():
+            created.update(self.add_item(workspace_id, item_type, display_name, body.get("definition")))
+        return self._start_operation(created, on_success=finish)
+
+    def _start_operation(self, result, on_success=None):
+        operation_id = str(uuid.uuid4())
+        with self._lock:
+            failed = self._random.random() < self.lro_failure_rate
+            self.operations[operation_id] = {"polls": self.lro_polls, "result": result, "failed": failed, "on_success": on_success}
+        headers = {"Location": f"{self.url}/operations/{operation_id}", "x-ms-operation-id": operation_id,
+                   "Retry-After": str(self.lro_retry_after)}
+        return 202, None, headers
+
+    def _poll(self, operation_id):
+        with self._lock:
+            op = self.operations[operation_id]
+            op["polls"] -= 1
+            running = op["polls"] > 0
+            finish, op["on_success"] = op["on_success"], None
+        if running:
+            return 200, {"status": "Running"}, {"Retry-After": str(self.lro_retry_after)}
+        if op["failed"]:
+            return 200, {"status": "Failed", "error": {"errorCode": "OperationFailed", "message": "failure injected by the mock"}}, {}
+        if finish:
+            finish()
+        return 200, {"status": "Succeeded"}, {}
+
+
+def _endpoint(parts):
+    # the path without ids, e.g. workspaces/items/getDefinition
+    names = {"workspaces", "items", "lakehouses", "notebooks", "operations", "result", "getDefinition", "updateDefinition"}
+    return "/".join(part for part in parts if part in names)
+
+
+def _handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # headers and body are written separately, without this every response waits for a delayed ack
+        disable_nagle_algorithm = True
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            status, body, headers = mock.handle(self.command, self.path, json.loads(raw) if raw else {})
+            data = json.dumps(body).encode() if body is not None else b""
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            if data:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_PATCH = do_DELETE = _handle
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
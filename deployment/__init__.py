@@ -1,2 +1,20 @@
+from .analysis import *
+from .auth import *
+from .bootstrap import *
 from .config import *
-from .run import *
\ No newline at end of file
+from .diff import *
+from .executor import *
+from .fanout import *
+from .inventory import *
+from .journal import *
+from .manifest import *
+from .mapping import *
+from .plan import *
+from .promotion import *
+from .repository import *
+from .run import *
+from .scanner import *
+from .state import *
+from .store import *
+from .substitution import *
+from .watch import *
\ No newline at end of file
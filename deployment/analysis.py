@@ -0,0 +1,170 @@
+import json
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from deployment.substitution import GUID_PATTERN
+
+META_PREFIX = "# META"
+# abfss://<workspace id>@onelake.dfs.fabric.microsoft.com/<item id>/...
+ONELAKE_PATTERN = re.compile(rf"abfss://({GUID_PATTERN})@onelake\.dfs\.fabric\.microsoft\.com/({GUID_PATTERN})")
+# %run <notebook> in a code or magic cell, and notebookutils.notebook.run("<notebook>", ...).
+# %run with an option, e.g. -b / --builtin, runs a resource file of the notebook, not another notebook
+RUN_MAGIC_PATTERN = re.compile(r"^(?:#\s*MAGIC\s+)?%run\s+(?!-)(?:\"([^\"]+)\"|'([^']+)'|([^\s\"'{]+))", re.MULTILINE)
+# %run script.py and the like run a file, notebooks are referenced without an extension
+RUN_FILE_SUFFIXES = (".py", ".sql", ".r", ".scala", ".ipynb")
+RUN_CALL_PATTERN = re.compile(r"(?:notebookutils|mssparkutils)\.notebook\.run\(\s*[\"']([^\"']+)[\"']")
+
+
+class NotebookReferences:
+    """
+    The workspace, lakehouse and notebook references found in one notebook.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.workspaces = set()
+        self.lakehouses = set()
+        self.items = set()
+        self.notebooks = set()
+
+
+def extract_references(name, content):
+    """
+    Returns the NotebookReferences of a notebook-content.py: the default and
+    known lakehouses and their workspace from the META blocks, OneLake paths
+    and notebooks run with %run or notebookutils.notebook.run.
+    """
+    refs = NotebookReferences(name)
+    block = []
+    for line in content.splitlines() + [""]:
+        # not the '# METADATA ****' line that starts a metadata cell
+        if line == META_PREFIX or line.startswith(META_PREFIX + " "):
+            block.append(line[len(META_PREFIX):])
+        elif block:
+            try:
+                _collect_meta(json.loads("\n".join(block)), refs)
+            except ValueError:
+                pass
+            block = []
+    for workspace_id, item_id in ONELAKE_PATTERN.findall(content):
+        refs.workspaces.add(workspace_id)
+        refs.items.add(item_id)
+    for groups in RUN_MAGIC_PATTERN.findall(content):
+        name = next(filter(None, groups))
+        if not name.lower().endswith(RUN_FILE_SUFFIXES):
+            refs.notebooks.add(name)
+    refs.notebooks.update(RUN_CALL_PATTERN.findall(content))
+    return refs
+
+
+def _collect_meta(value, refs):
+    if isinstance(value, dict):
+        for key, child in value.items():
+            if key == "default_lakehouse" and isinstance(child, str) and child:
+                refs.lakehouses.add(child)
+            elif key == "default_lakehouse_workspace_id" and isinstance(child, str) and child:
+                refs.workspaces.add(child)
+            elif key == "known_lakehouses" and isinstance(child, list):
+                refs.lakehouses.update(lh["id"] for lh in child if isinstance(lh, dict) and lh.get("id"))
+            else:
+                _collect_meta(child, refs)
+    elif isinstance(value, list):
+        for child in value:
+            _collect_meta(child, refs)
+
+
+class DependencyGraph:
+    """
+    The items every git notebook depends on, keyed by (type, display name), and
+    the references that do not resolve within the source workspace.
+    """
+    def __init__(self):
+        self.dependencies = {}
+        self.problems = []
+
+    def add(self, item, dependency):
+        self.dependencies.setdefault(item, set()).add(dependency)
+
+    def dependencies_of(self, item_type, display_name):
+        return self.dependencies.get((item_type, display_name), set())
+
+    def edge_count(self):
+        return sum(len(deps) for deps in self.dependencies.values())
+
+    def find_cycles(self, item_type='Notebook'):
+        """
+        Returns the cycles among the dependencies of the given item type, each as
+        a list of display names.
+        """
+        cycles = []
+        state = {}
+
+        def visit(node, path):
+            state[node] = "visiting"
+            path.append(node)
+            for dep in sorted(self.dependencies.get(node, ())):
+                if dep[0] != item_type:
+                    continue
+                if state.get(dep) == "visiting":
+                    cycles.append([name for _, name in path[path.index(dep):]] + [dep[1]])
+                elif dep not in state:
+                    visit(dep, path)
+            path.pop()
+            state[node] = "done"
+
+        for node in sorted(self.dependencies):
+            if node[0] == item_type and node not in state:
+                visit(node, [])
+        return cycles
+
+
+def analyze_notebooks(items_git, read_notebook, source_workspace_id, source_items, max_workers=8):
+    """
+    Reads every git notebook in parallel, in one pass, and builds the graph of
+    the lakehouses and notebooks it depends on.
+
+    A reference is a problem if it points to another workspace, to a lakehouse
+    or item that does not exist in the source workspace, or to a notebook that
+    is not in the repo. Notebooks that run each other in a cycle are problems
+    as well, since the graph orders the deployment.
+
+    Args:
+        items_git (list): The git items, as scanned or loaded from a plan.
+        read_notebook (callable): Returns the raw notebook-content.py of a git notebook item.
+        source_workspace_id (str): The workspace the notebooks are developed in.
+        source_items (list): The items of the source workspace.
+
+    Returns:
+        DependencyGraph: The dependencies and the problems found.
+    """
+    notebooks = [item for item in items_git if item.get('type') == 'Notebook']
+    notebook_names = {item['displayName'] for item in notebooks}
+    source_by_id = {item['id']: item for item in source_items}
+
+    def extract(item):
+        content = read_notebook(item).decode('utf-8', errors='replace')
+        return extract_references(item['displayName'], content)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        all_refs = list(pool.map(extract, notebooks))
+
+    graph = DependencyGraph()
+    for refs in all_refs:
+        node = ('Notebook', refs.name)
+        graph.dependencies.setdefault(node, set())
+        for workspace_id in sorted(refs.workspaces - {source_workspace_id}):
+            graph.problems.append(f"notebook {refs.name} references workspace {workspace_id}, not the source workspace")
+        for item_id in sorted(refs.lakehouses | refs.items):
+            item = source_by_id.get(item_id)
+            if item is None:
+                kind = "lakehouse" if item_id in refs.lakehouses else "item"
+                graph.problems.append(f"notebook {refs.name} references {kind} {item_id}, which is not in the source workspace")
+            else:
+                graph.add(node, (item.get('type'), item.get('displayName')))
+        for name in sorted(refs.notebooks):
+            if name not in notebook_names:
+                graph.problems.append(f"notebook {refs.name} runs notebook {name}, which is not in the repo")
+            elif name != refs.name:
+                graph.add(node, ('Notebook', name))
+    for cycle in graph.find_cycles():
+        graph.problems.append(f"notebooks run each other in a cycle: {' -> '.join(cycle)}")
+    return graph
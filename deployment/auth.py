@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+from helpers.trace import span
+
+FABRIC_SCOPE = 'https://analysis.windows.net/powerbi/api/.default'
+AUTH_METHODS = ['interactive', 'client_secret', 'workload_identity', 'default']
+# refresh the token this many seconds before it expires
+REFRESH_MARGIN = 300
+# wait this many seconds before retrying a failed refresh
+REFRESH_RETRY_INTERVAL = 30
+
+
+class AuthError(Exception):
+    """
+    The configured auth method cannot sign in, e.g. because a secret is missing.
+    """
+
+
+def create_credential(method, tenant_id, client_id=None):
+    """
+    Creates the azure credential for the configured auth method.
+
+    client_secret reads the secret from the AZURE_CLIENT_SECRET environment
+    variable, workload_identity the token file from AZURE_FEDERATED_TOKEN_FILE.
+
+    Raises:
+        AuthError: If the auth method is unknown or misses its client id or secret.
+    """
+    # azure.identity is slow to import, so it is only loaded when signing in
+    from azure.identity import ClientSecretCredential, DefaultAzureCredential, InteractiveBrowserCredential, WorkloadIdentityCredential
+
+    if method == 'interactive':
+        return InteractiveBrowserCredential(tenant_id=tenant_id)
+    if method == 'client_secret':
+        secret = os.environ.get('AZURE_CLIENT_SECRET')
+        if not client_id or not secret:
+            raise AuthError("auth method client_secret needs auth.client_id and the AZURE_CLIENT_SECRET environment variable")
+        return ClientSecretCredential(tenant_id, client_id, secret)
+    if method == 'workload_identity':
+        return WorkloadIdentityCredential(tenant_id=tenant_id, client_id=client_id)
+    if method == 'default':
+        return DefaultAzureCredential()
+    raise AuthError(f"unknown auth method {method}, expected one of {', '.join(AUTH_METHODS)}")
+
+
+class TokenBroker:
+    """
+    Keeps the access token in memory and refreshes it in a background thread
+    shortly before it expires.
+
+    headers() never blocks, so concurrent workers always get the current token.
+    If cache_path is given, the token is also read from and written to that
+    file, which spares interactive users a login on every run.
+    """
+    def __init__(self, credential, scope=FABRIC_SCOPE, cache_path=None, refresh_margin=REFRESH_MARGIN):
+        self.credential = credential
+        self.scope = scope
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self._token = None
+        self._expires_on = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """
+        Obtains the first token and starts the background refresh.
+
+        Raises:
+            AuthError: If the credential cannot get a token.
+        """
+        if not self._load_cached_token():
+            try:
+                self.refresh()
+            except Exception as e:
+                raise AuthError(f"could not sign in: {e}") from e
+        self._thread = threading.Thread(target=self._refresh_loop, name="token-refresh", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def token(self):
+        return self._token
+
+    @property
+    def expires_on(self):
+        return self._expires_on
+
+    def headers(self):
+        return {"Authorization": f"Bearer {self._token}"}
+
+    def refresh(self):
+        """
+        Requests a new token from the credential.
+        """
+        with self._lock, span("token refresh", "auth"):
+            access_token = self.credential.get_token(self.scope)
+            self._token = access_token.token
+            self._expires_on = access_token.expires_on
+            if self.cache_path:
+                os.makedirs(os.path.dirname(self.cache_path) or '.', exist_ok=True)
+                with open(self.cache_path, "w") as f:
+                    f.write(self._token)
+
+    def _load_cached_token(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return False
+        import jwt
+
+        with open(self.cache_path, "r") as f:
+            cached_token = f.read()
+        try:
+            expires_on = jwt.decode(cached_token, options={"verify_signature": False}).get("exp", 0)
+        except jwt.PyJWTError:
+            return False
+        if expires_on - self.refresh_margin < time.time():
+            return False
+        self._token = cached_token
+        self._expires_on = expires_on
+        return True
+
+    def _refresh_loop(self):
+        while True:
+            wait = self._expires_on - self.refresh_margin - time.time()
+            if self._stop.wait(max(wait, 0)):
+                return
+            try:
+                self.refresh()
+            except Exception:
+                # keep the current token and try again shortly
+                if self._stop.wait(REFRESH_RETRY_INTERVAL):
+                    return
@@ -0,0 +1,68 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prompt_toolkit import print_formatted_text as print
+
+from deployment.config import Config
+from deployment.fanout import MultiTargetDeployment
+from deployment.run import Runner
+from helpers.trace import span
+
+
+def create_deployment(config: Config):
+    """
+    Returns a Runner for a single target or a MultiTargetDeployment for several.
+    """
+    if len(config.targets) > 1:
+        return MultiTargetDeployment(config)
+    return Runner(config)
+
+
+def bootstrap(config: Config, prepare_repo=None, create=None):
+    """
+    Brings up everything a deployment needs, overlapping the steps that do not
+    depend on each other: the repo is prepared (e.g. cloned) while signing in,
+    then the config is validated while the workspaces are listed and the repo
+    is scanned.
+
+    Args:
+        config (Config): A config, connected or not.
+        prepare_repo (callable): Makes the repo available at config.repo_local_path.
+        create (callable): Creates the deployment from the connected config instead
+            of create_deployment, e.g. create_promotion.
+
+    Returns:
+        Runner or MultiTargetDeployment: The deployment, ready to compute its plan.
+    """
+    timings = {}
+
+    def timed(name, func, *args):
+        start = time.perf_counter()
+        try:
+            with span(name, "bootstrap"):
+                return func(*args)
+        finally:
+            timings[name] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        repo = pool.submit(timed, "repo", prepare_repo) if prepare_repo else None
+        if config.client is None:
+            # interactive sign in opens a browser, keep it on the main thread
+            timed("sign in", config.connect)
+        validation = pool.submit(timed, "validate", config.validate)
+        if repo:
+            repo.result()
+        try:
+            if create is None:
+                deployment = timed("inventory and scan", create_deployment, config)
+            else:
+                deployment = timed("inventory and definitions", create, config)
+        except Exception:
+            # an invalid config usually explains the failure better
+            validation.result()
+            raise
+        validation.result()
+
+    details = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    print(f"...Ready after {time.perf_counter() - start:.2f}s ({details})")
+    return deployment
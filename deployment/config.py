@@ -1,25 +1,51 @@
-from azure.identity import InteractiveBrowserCredential
 import tomllib
-import os
-import jwt
 import time
 from pathlib import Path
 import sys
 from prompt_toolkit import print_formatted_text as print
 from prompt_toolkit import HTML
-from helpers.fabric import get_workspaces
+from deployment.auth import AUTH_METHODS, TokenBroker, create_credential
+from helpers.fabric import FabricClient, iter_workspaces
 
 TOKEN_CACHE_PATH = "temp/token.txt"
 CONFIG_FILE_PATH = "config/deploy.toml"
+DEFAULT_MAX_WORKERS = 8
+# seconds between checks for changes and without further changes before a push in watch mode
+DEFAULT_WATCH_INTERVAL = 0.5
+DEFAULT_WATCH_DEBOUNCE = 1.0
+
+class Target:
+    """
+    A workspace to deploy to, with its own limit of parallel operations.
+    """
+    def __init__(self, name, workspace_id, max_workers):
+        self.name = name
+        self.workspace_id = workspace_id
+        self.max_workers = max_workers
 
 class Config:
-    def __init__(self):
+    def __init__(self, connect=True):
+        """
+        Reads the config file. Unless connect is False, also signs in and
+        validates the configured workspaces (see connect() and validate()).
+        """
+        self.token_broker = None
+        self.client = None
         self._process_config_file(CONFIG_FILE_PATH)
-        token = self._retrieve_token()
-        self.token = token
-        self.user_headers = {"Authorization": f"Bearer {token}"}
+        if connect:
+            self.connect()
+            self.validate()
+
+    def connect(self):
+        """
+        Signs in and creates the client for the Fabric api.
+        """
+        self.token_broker = self._start_token_broker()
+        self.client = FabricClient(self.token_broker.headers, pool_size=sum(target.max_workers for target in self.targets))
+
+    def validate(self):
         self._validate_config()
-        
+
 
     def _process_config_file(self, path):
         """
@@ -27,66 +53,90 @@ class Config:
         """
         with open(path, "rb") as f:
             deploy_config = tomllib.load(f)
-            self.target_workspace_id = deploy_config.get("target").get("workspace_id")
-            self.source_workspace_id = deploy_config.get("source").get("workspace_id")
+            self.target_workspace_id = deploy_config.get("target", {}).get("workspace_id")
+            self.source_workspace_id = deploy_config.get("source", {}).get("workspace_id")
             self.repo_remote_url = deploy_config.get("repo_remote_url")
+            self.repo_ref = deploy_config.get("repo_ref")
             self.az_tenant_id = deploy_config.get('az_tenant_id')
+            self.max_workers = deploy_config.get('max_workers', DEFAULT_MAX_WORKERS)
+            self.item_root = deploy_config.get('item_root', '')
+            self.auth_method = deploy_config.get('auth', {}).get('method', 'interactive')
+            self.auth_client_id = deploy_config.get('auth', {}).get('client_id')
+            self.watch_workspace_id = deploy_config.get('watch', {}).get('workspace_id')
+            self.watch_interval = deploy_config.get('watch', {}).get('interval', DEFAULT_WATCH_INTERVAL)
+            self.watch_debounce = deploy_config.get('watch', {}).get('debounce', DEFAULT_WATCH_DEBOUNCE)
+            targets = deploy_config.get('targets', [])
 
-        for value in ['target.workspace_id', 'source.workspace_id', 'repo_remote_url', 'az_tenant_id']:
+        if targets:
+            # several [[targets]] replace the single target.workspace_id
+            self.targets = [Target(t.get("name") or t.get("workspace_id") or f"#{i + 1}", t.get("workspace_id"), t.get("max_workers", self.max_workers))
+                            for i, t in enumerate(targets)]
+            self.target_workspace_id = self.targets[0].workspace_id
+        else:
+            self.targets = [Target("target", self.target_workspace_id, self.max_workers)]
+
+        # the workspace ids of [[targets]] are checked per target below
+        required = ['source.workspace_id', 'repo_remote_url', 'az_tenant_id'] if targets else ['target.workspace_id', 'source.workspace_id', 'repo_remote_url', 'az_tenant_id']
+        for value in required:
             if not eval('self.' + value.replace('.','_')):
                 print(HTML(f"<ansired><b>ERROR</b>: property {value} missing from config file at {path}</ansired>"))
                 sys.exit(1)
 
+        if self.auth_method not in AUTH_METHODS:
+            print(HTML(f"<ansired><b>ERROR</b>: property auth.method must be one of {', '.join(AUTH_METHODS)} in config file at {path}</ansired>"))
+            sys.exit(1)
+
+        for target in self.targets:
+            if not target.workspace_id:
+                print(HTML(f"<ansired><b>ERROR</b>: property workspace_id missing for target {target.name} in config file at {path}</ansired>"))
+                sys.exit(1)
+            if not isinstance(target.max_workers, int) or target.max_workers < 1:
+                print(HTML(f"<ansired><b>ERROR</b>: property max_workers must be a positive integer in config file at {path}</ansired>"))
+                sys.exit(1)
+
     def _validate_config(self):
         """
         Raises an error if the configuration is invalid
         """
-        workspaces = get_workspaces(self.user_headers)
-        if self.target_workspace_id not in workspaces:
-            print(HTML(f"<ansired><b>ERROR</b>: target workspace {self.target_workspace_id} not accessible</ansired>"))
-            sys.exit(1)
-        if self.source_workspace_id not in workspaces:
+        missing = {target.workspace_id for target in self.targets}
+        missing.add(self.source_workspace_id)
+        for workspace in iter_workspaces(self.client):
+            missing.discard(workspace.get("id"))
+            if not missing:
+                break
+        for target in self.targets:
+            if target.workspace_id in missing:
+                print(HTML(f"<ansired><b>ERROR</b>: target workspace {target.workspace_id} not accessible</ansired>"))
+                sys.exit(1)
+        if self.source_workspace_id in missing:
             print(HTML(f"<ansired><b>ERROR</b>: source workspace {self.source_workspace_id} not accessible</ansired>"))
             sys.exit(1)
 
-    def cache_access_token_interactive(self):
+    def _start_token_broker(self):
         """
-        Obtain an access token interactively.
+        Signs in with the configured auth method and starts refreshing the token
+        in the background. Interactive tokens are cached at TOKEN_CACHE_PATH.
         """
-        scope = ['https://analysis.windows.net/powerbi/api/.default']
-        credential = InteractiveBrowserCredential(tenant_id=self.az_tenant_id)
-        user_token = credential.get_token(*scope).token
-        with open(TOKEN_CACHE_PATH, "w") as f:
-            f.write(user_token)
+        credential = create_credential(self.auth_method, self.az_tenant_id, self.auth_client_id)
+        cache_path = TOKEN_CACHE_PATH if self.auth_method == 'interactive' else None
+        broker = TokenBroker(credential, cache_path=cache_path).start()
+        valid_until = time.strftime("%H:%M:%S", time.localtime(broker.expires_on))
+        print(f"...Signed in ({self.auth_method}), token valid until {valid_until} and refreshed automatically")
+        return broker
+
+    @property
+    def token(self):
+        return self.token_broker.token
+
+    @property
+    def user_headers(self):
+        return self.token_broker.headers()
 
-    def _retrieve_token(self): 
-        """
-        Check if there is an unexpired cached token and otherwise log user in.
-        Store the token at token_path and return it
-        """
-        if not os.path.isfile(TOKEN_CACHE_PATH):
-            print(f"caching token at {TOKEN_CACHE_PATH}")
-            self.cache_access_token_interactive()
-        else:
-            with open(TOKEN_CACHE_PATH, "r") as f:
-                cached_token = f.read()
-            decoded = jwt.decode(cached_token, options={"verify_signature": False}) 
-            expiration_ts = decoded.get("exp")
-            current_ts = int(time.time())
-            if current_ts > expiration_ts:
-                print(f"...Cached token expired. chaching token at {TOKEN_CACHE_PATH}")
-                self.cache_access_token_interactive()
-            else:
-                print(f"...Using cached token at {TOKEN_CACHE_PATH}")
-        with open(TOKEN_CACHE_PATH, "r") as f:
-            token = f.read()
-        return token
-        
     def set_repo_local_path(self, path: Path):
         self.repo_local_path = path
 
     def set_user_headers(self, headers):
-        self.user_headers = headers
+        self.client.set_auth_header(headers)
     
     def set_user_token(self, token):
         self.user_token = token
@@ -0,0 +1,107 @@
+from deployment.scanner import ITEM_CONTENT_FILES
+
+DIFF_CLASSES = ['new', 'changed', 'unchanged', 'dangling']
+
+
+class ItemIndex:
+    """
+    The items of one side of a diff, indexed once by (type, logicalId) and by
+    (type, displayName).
+
+    Workspace items do not carry the logicalId of the git item they were created
+    from, logical_ids maps item ids to it where it is known.
+    """
+    def __init__(self, items, item_types=None, logical_ids=None):
+        logical_ids = logical_ids or {}
+        self.items = []
+        self.by_logical_id = {}
+        self.by_name = {}
+        for item in items:
+            if item_types is not None and item.get('type') not in item_types:
+                continue
+            self.items.append(item)
+            logical_id = item.get('logicalId') or logical_ids.get(item.get('id'))
+            if logical_id:
+                self.by_logical_id[(item['type'], logical_id)] = item
+            self.by_name[(item['type'], item.get('displayName'))] = item
+
+    def get_by_logical_id(self, item_type, logical_id):
+        return self.by_logical_id.get((item_type, logical_id)) if logical_id else None
+
+    def get(self, item_type, display_name):
+        return self.by_name.get((item_type, display_name))
+
+
+def diff_items(git_items, target_items, item_types, deployed_hash=None, logical_ids=None, compare=None):
+    """
+    Classifies the git and target items of the given types as new, changed,
+    unchanged or dangling, with one pass over each side.
+
+    A git item is matched to the target item deployed from the same logicalId,
+    otherwise to the target item with the same type and display name. A target
+    item matched by logicalId under another display name is renamed. A matched
+    item is changed if the hash of its content file differs from
+    deployed_hash(target_item). Types without a content file in
+    ITEM_CONTENT_FILES are unchanged once they exist.
+
+    Args:
+        git_items (list): Items scanned from the repo.
+        target_items (list): Items of the target workspace.
+        item_types (list): The item types to diff, others are left out on both sides.
+        deployed_hash (callable): Returns the content hash a target item was deployed with, or None.
+        logical_ids (dict): Target item id -> logicalId it was deployed from.
+        compare (dict): Item type -> callable that gets the matched (git item, target item)
+            pairs of that type and returns the changed and the unchanged pairs.
+
+    Returns:
+        dict: Item type -> dict with the display names of the 'new', 'changed',
+            'unchanged' and 'dangling' items, 'matches', the target id of every
+            matched git item, and 'renamed', the current display name of every
+            matched target item that has another name in git.
+    """
+    compare = compare or {}
+    target_index = ItemIndex(target_items, item_types, logical_ids)
+    diff = {item_type: {**{cls: [] for cls in DIFF_CLASSES}, "matches": {}, "renamed": {}} for item_type in item_types}
+    git_items = [item for item in git_items if item.get('type') in diff]
+
+    # logicalId matches take precedence over display name matches
+    matches = {}
+    matched_ids = set()
+    for i, item in enumerate(git_items):
+        target = target_index.get_by_logical_id(item['type'], item.get('logicalId'))
+        if target is not None and target['id'] not in matched_ids:
+            matches[i] = target
+            matched_ids.add(target['id'])
+    for i, item in enumerate(git_items):
+        if i in matches:
+            continue
+        target = target_index.get(item['type'], item.get('displayName'))
+        if target is not None and target['id'] not in matched_ids:
+            matches[i] = target
+            matched_ids.add(target['id'])
+
+    pairs = {item_type: [] for item_type in item_types}
+    for i, item in enumerate(git_items):
+        if i in matches:
+            pairs[item['type']].append((item, matches[i]))
+            diff[item['type']]["matches"][item['displayName']] = matches[i]['id']
+            if matches[i].get('displayName') != item['displayName']:
+                diff[item['type']]["renamed"][item['displayName']] = matches[i].get('displayName')
+        else:
+            diff[item['type']]["new"].append(item['displayName'])
+    for target in target_index.items:
+        if target['id'] not in matched_ids:
+            diff[target['type']]["dangling"].append(target.get('displayName'))
+
+    for item_type, type_pairs in pairs.items():
+        if item_type in compare:
+            changed, unchanged = compare[item_type](type_pairs)
+        elif ITEM_CONTENT_FILES.get(item_type) is None:
+            changed, unchanged = [], type_pairs
+        else:
+            deployed = [deployed_hash(target) if deployed_hash else None for _, target in type_pairs]
+            changed = [pair for pair, content_hash in zip(type_pairs, deployed) if pair[0].get('hash') != content_hash]
+            unchanged = [pair for pair, content_hash in zip(type_pairs, deployed) if pair[0].get('hash') == content_hash]
+        diff[item_type]["changed"] = [item['displayName'] for item, _ in changed]
+        diff[item_type]["unchanged"] = [item['displayName'] for item, _ in unchanged]
+    return diff
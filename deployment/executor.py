@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from html import escape
+from prompt_toolkit import print_formatted_text as print
+from prompt_toolkit import HTML
+
+from helpers.trace import span
+
+
+class Operation:
+    """
+    A single step of a deployment plan, together with the operations it depends
+    on and the operations that only have to be finished before it starts.
+    """
+    def __init__(self, name, func, args=(), depends_on=None, group=None, after=None):
+        self.name = name
+        self.group = group
+        self.func = func
+        self.args = args
+        self.depends_on = list(depends_on or [])
+        self.after = list(after or [])
+        self.status = "pending"
+        self.result = None
+        self.error = None
+        self.duration = None
+
+    def _execute(self):
+        start = time.perf_counter()
+        try:
+            with span(self.name, "operation", self.group):
+                return self.func(*self.args)
+        finally:
+            self.duration = time.perf_counter() - start
+
+
+class Executor:
+    """
+    Runs a dependency graph of operations on a bounded pool of worker threads.
+
+    An operation is started as soon as all of its dependencies have succeeded.
+    If a dependency fails (or is skipped) the operation is skipped as well.
+    Operations it runs after only have to be finished, whatever their outcome.
+    """
+    def __init__(self, max_workers):
+        self.max_workers = max_workers
+        self.operations = []
+
+    def add(self, name, func, *args, depends_on=None, group=None, after=None):
+        """
+        Adds an operation. Operations of the same kind, e.g. all notebook
+        creations, can share a group to be aggregated in the trace summary.
+        """
+        op = Operation(name, func, args, depends_on, group, after)
+        self.operations.append(op)
+        return op
+
+    def run(self):
+        """
+        Executes all operations and returns True if every operation succeeded.
+        """
+        pending = list(self.operations)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while pending or running:
+                changed = True
+                while changed:
+                    changed = False
+                    for op in list(pending):
+                        dep_states = [dep.status for dep in op.depends_on]
+                        finished = all(prev.status in ("succeeded", "failed", "skipped") for prev in op.after)
+                        if any(state in ("failed", "skipped") for state in dep_states):
+                            op.status = "skipped"
+                        elif finished and all(state == "succeeded" for state in dep_states):
+                            op.status = "running"
+                            running[pool.submit(op._execute)] = op
+                        else:
+                            continue
+                        pending.remove(op)
+                        changed = True
+
+                if not running:
+                    if pending:
+                        raise ValueError("Deployment plan contains a dependency cycle")
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    op = running.pop(future)
+                    try:
+                        op.result = future.result()
+                        op.status = "succeeded"
+                    except BaseException as e:
+                        op.error = e
+                        op.status = "failed"
+
+        return all(op.status == "succeeded" for op in self.operations)
+
+    def print_summary(self):
+        """
+        Prints one line per operation, in the order they were added to the plan.
+        """
+        styles = {
+            "succeeded": "<ansigreen>OK     </ansigreen>",
+            "failed": "<ansired>FAILED </ansired>",
+            "skipped": "<ansiyellow>SKIPPED</ansiyellow>",
+        }
+        print("\nDeployment summary:\n")
+        for op in self.operations:
+            line = f"{styles.get(op.status, op.status)} {escape(op.name)}"
+            if op.duration is not None:
+                line += f" ({op.duration:.2f}s)"
+            if op.error is not None:
+                line += f" - {escape(str(op.error) or type(op.error).__name__)}"
+            print(HTML(line))
+
+        counts = {status: 0 for status in styles}
+        for op in self.operations:
+            counts[op.status] = counts.get(op.status, 0) + 1
+        print(f"\n{counts['succeeded']} succeeded, {counts['failed']} failed, {counts['skipped']} skipped\n")
@@ -0,0 +1,96 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
+from prompt_toolkit import print_formatted_text as print
+from prompt_toolkit import HTML
+
+from deployment.config import Config
+from deployment.run import Runner
+
+
+class MultiTargetDeployment:
+    """
+    Deploys one scan of the git repo to several target workspaces.
+
+    The repo is scanned once and shared by one Runner per target. Plans are
+    computed and applied for all targets in parallel, each target limited to its
+    own max_workers, and a combined summary is printed at the end.
+    """
+    def __init__(self, config: Config, runners=None):
+        """
+        Creates a runner per configured target, unless the runners are given,
+        e.g. loaded from a plan file.
+        """
+        self.config = config
+        if runners is None:
+            first = Runner(config, config.targets[0])
+            with ThreadPoolExecutor(max_workers=len(config.targets)) as pool:
+                others = list(pool.map(lambda target: Runner(config, target, first.items_git, first.manifest, first.inventory_src), config.targets[1:]))
+            runners = [first] + others
+        self.runners = runners
+        self.durations = {}
+
+    def compute_plan(self):
+        self.runners[0].run_source_checks()
+        for runner in self.runners[1:]:
+            runner.dependencies = self.runners[0].dependencies
+        with ThreadPoolExecutor(max_workers=len(self.runners)) as pool:
+            list(pool.map(lambda runner: runner.compute_plan(source_checks=False), self.runners))
+
+    def print_plan(self):
+        for runner in self.runners:
+            print(HTML(f"\n<b>Target {escape(runner.target.name)}</b> ({runner.target.workspace_id})"))
+            runner.print_plan()
+
+    def run(self):
+        """
+        Applies the plans of all targets concurrently and returns True if all of them succeeded.
+        """
+        print("")
+        for runner in self.runners:
+            runner.prepare_execution()
+            done = runner.journal.count()
+            if done:
+                print(f"...{runner.target.name}: resuming, {done} steps finished by a previous attempt are skipped")
+            print(f"...{runner.target.name}: running {len(runner.executor.operations)} operations with {runner.target.max_workers} workers")
+
+        with ThreadPoolExecutor(max_workers=len(self.runners)) as pool:
+            results = list(pool.map(self._execute, self.runners))
+
+        for runner in self.runners:
+            print(HTML(f"\n<b>Target {escape(runner.target.name)}</b> ({runner.target.workspace_id})"))
+            runner.print_run_summary()
+        self.print_summary(results)
+        self.config.client.controller.print_summary()
+
+        succeeded = all(results)
+        if succeeded:
+            print("...All done.")
+        else:
+            print(HTML("<ansired><b>ERROR</b>: deployment finished with errors</ansired>"))
+            for runner, target_succeeded in zip(self.runners, results):
+                if not target_succeeded:
+                    print(f"...{runner.target.name}: {runner.journal.count()} finished steps are recorded in {runner.journal.path}")
+        return succeeded
+
+    def _execute(self, runner):
+        start = time.perf_counter()
+        try:
+            return runner.execute()
+        finally:
+            self.durations[runner.target.name] = time.perf_counter() - start
+
+    def print_summary(self, results):
+        """
+        Prints one line per target with the number of succeeded, failed and skipped operations.
+        """
+        width = max(len(runner.target.name) for runner in self.runners)
+        print(f"\nCombined summary:\n")
+        for runner, succeeded in zip(self.runners, results):
+            counts = {"succeeded": 0, "failed": 0, "skipped": 0}
+            for op in runner.executor.operations:
+                counts[op.status] = counts.get(op.status, 0) + 1
+            status = "<ansigreen>OK     </ansigreen>" if succeeded else "<ansired>FAILED </ansired>"
+            print(HTML(f"{status} {escape(runner.target.name.ljust(width))}  {counts['succeeded']} succeeded, {counts['failed']} failed, "
+                       f"{counts['skipped']} skipped ({self.durations[runner.target.name]:.2f}s)"))
+        print("")
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import threading
+
+from helpers.fabric import FabricItemNotFoundError, iter_items
+
+
+class WorkspaceInventory:
+    """
+    The items of one workspace, indexed by (type, displayName) and by id.
+
+    The item list is fetched on first use and afterwards kept up to date by the
+    runner through add() and remove(), so the workspace is listed only once.
+    If item_types is given, only items of these types are fetched.
+    """
+    def __init__(self, client, workspace_id, item_types=None):
+        self.client = client
+        self.workspace_id = workspace_id
+        self.item_types = item_types
+        self._lock = threading.Lock()
+        self._by_id = None
+        self._by_name = None
+
+    def load(self):
+        """
+        Fetches the item list of the workspace unless it was fetched already.
+        """
+        self._index()
+        return self
+
+    def seed(self, items):
+        """
+        Uses the given items instead of fetching them, e.g. the items recorded in a plan file.
+        """
+        with self._lock:
+            self._by_id = {}
+            self._by_name = {}
+            for item in items:
+                self._add(item)
+        return self
+
+    def version(self):
+        """
+        Returns a fingerprint of the ids, types and names of all items, which
+        changes whenever an item is added, removed or renamed.
+        """
+        keys = sorted((item['id'], item.get('type') or '', item.get('displayName') or '') for item in self.items)
+        return hashlib.sha1(json.dumps(keys).encode()).hexdigest()
+
+    def _index(self):
+        with self._lock:
+            if self._by_id is None:
+                self._by_id = {}
+                self._by_name = {}
+                for item_type in self.item_types or [None]:
+                    for item in iter_items(self.client, self.workspace_id, item_type):
+                        self._add(item)
+            return self._by_id, self._by_name
+
+    def _add(self, item):
+        self._by_id[item['id']] = item
+        self._by_name[(item.get('type'), item.get('displayName'))] = item
+
+    @property
+    def items(self):
+        by_id, _ = self._index()
+        with self._lock:
+            return list(by_id.values())
+
+    def of_type(self, item_type):
+        return [item for item in self.items if item.get('type') == item_type]
+
+    def get(self, item_type, display_name):
+        _, by_name = self._index()
+        with self._lock:
+            return by_name.get((item_type, display_name))
+
+    def get_by_id(self, item_id):
+        by_id, _ = self._index()
+        with self._lock:
+            return by_id.get(item_id)
+
+    def require(self, item_type, display_name):
+        """
+        Returns the item with the given type and display name or raises FabricItemNotFoundError.
+        """
+        item = self.get(item_type, display_name)
+        if not item:
+            raise FabricItemNotFoundError(f"No {item_type} with display_name {display_name} found in workspace {self.workspace_id}")
+        return item
+
+    def add(self, item):
+        """
+        Adds an item the runner created. If the api did not return the created item
+        the inventory is fetched again on next use.
+        """
+        with self._lock:
+            if self._by_id is None:
+                return
+            if item and item.get('id'):
+                self._add(item)
+            else:
+                self._by_id = None
+                self._by_name = None
+
+    def remove(self, item_id):
+        """
+        Removes an item the runner deleted.
+        """
+        with self._lock:
+            if self._by_id is None:
+                return
+            item = self._by_id.pop(item_id, None)
+            if item:
+                self._by_name.pop((item.get('type'), item.get('displayName')), None)
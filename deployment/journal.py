@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from pathlib import Path
+
+JOURNAL_DIRECTORY = "temp/journal"
+
+
+def plan_fingerprint(diff, inventory_version, commit):
+    """
+    Identifies the plan of one target, so that a journal is only resumed by the same plan.
+    """
+    data = json.dumps({"diff": diff, "inventory_version": inventory_version, "commit": commit}, sort_keys=True)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+def journal_step(action, item_type, display_name):
+    """
+    Returns the name of a journaled step, e.g. 'create Notebook nb1'.
+    """
+    return f"{action} {item_type} {display_name}"
+
+
+class DeployJournal:
+    """
+    Append-only record of the steps of one plan applied to one workspace.
+
+    Every create, update and delete is recorded as started before its request
+    is sent and as done once it completed, e.g. when its long-running operation
+    succeeded. Each line is flushed to disk right away, so the journal survives
+    a crash and a later attempt of the same plan can skip the finished steps.
+    """
+    def __init__(self, workspace_id, plan_id, directory=JOURNAL_DIRECTORY):
+        self.workspace_id = workspace_id
+        self.plan_id = plan_id
+        self.path = Path(directory) / f"{workspace_id}.jsonl"
+        self.steps = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        Reads the journal of a previous attempt. Returns False if there is none
+        or it belongs to another plan.
+        """
+        if not self.path.is_file():
+            return False
+        with open(self.path) as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        if not entries or entries[0].get("plan_id") != self.plan_id:
+            return False
+        for entry in entries[1:]:
+            self.steps[entry["step"]] = entry
+        return True
+
+    def start(self):
+        """
+        Starts an empty journal, replacing the one of an earlier plan.
+        """
+        self.steps = {}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock, open(self.path, "w") as f:
+            self._write(f, {"plan_id": self.plan_id, "workspace_id": self.workspace_id, "started": _now()})
+
+    def record(self, step, status, **details):
+        """
+        Appends the status ('started' or 'done') of a step, e.g. 'create Notebook nb1'.
+        """
+        entry = {"step": step, "status": status, "at": _now(), **details}
+        with self._lock, open(self.path, "a") as f:
+            self._write(f, entry)
+            self.steps[step] = entry
+
+    def status(self, step):
+        with self._lock:
+            entry = self.steps.get(step)
+            return entry["status"] if entry else None
+
+    def is_done(self, step):
+        return self.status(step) == "done"
+
+    def count(self, status="done"):
+        with self._lock:
+            return sum(1 for entry in self.steps.values() if entry["status"] == status)
+
+    def remove(self):
+        """
+        Deletes the journal once the whole plan succeeded.
+        """
+        with self._lock:
+            if self.path.is_file():
+                self.path.unlink()
+
+    def _write(self, f, entry):
+        f.write(json.dumps(entry) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='seconds')
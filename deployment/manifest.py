@@ -0,0 +1,165 @@
+import os
+import subprocess
+import threading
+from pathlib import Path
+
+from deployment.repository import git_env
+from deployment.store import load_json_file, save_json_entry
+from helpers.general import load_artifact
+
+SCAN_MANIFEST_PATH = "temp/scan_manifest.json"
+
+
+def _git(cwd, *args):
+    """
+    Runs a git command and returns its output, or None if git is not available
+    or the folder is not a git checkout.
+    """
+    try:
+        r = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, env=git_env())
+    except OSError:
+        return None
+    if r.returncode != 0:
+        return None
+    return r.stdout
+
+
+class ScanManifest:
+    """
+    On-disk record of the content hashes computed by previous scans of a repo.
+
+    A file is only hashed again if its git blob id changed or, for files that are
+    not committed as they are, if its mtime or size changed.
+
+    The items of the last scan are kept with the commit they were scanned at.
+    The next scan of the same item root only reads the item folders that git
+    reports as changed since that commit, and the ones that had uncommitted
+    changes back then.
+    """
+    def __init__(self, repo_key, path=SCAN_MANIFEST_PATH):
+        self.repo_key = repo_key
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self._seen = set()
+        self.hits = 0
+        self.misses = 0
+        entry = load_json_file(self.path).get(repo_key, {})
+        self.files = entry.get("files", {})
+        self.scanned_commit = entry.get("scanned_commit")
+        self.scanned_prefix = entry.get("scanned_prefix")
+        self.items = entry.get("items", {})
+        self.dirty = entry.get("dirty", [])
+        self.reused_items = 0
+
+    def attach(self, base_directory: Path):
+        """
+        Reads the blob ids of all committed files below base_directory. Files with
+        uncommitted changes get no blob id and fall back to mtime and size.
+        """
+        self._blobs = {}
+        tree = _git(base_directory, "ls-tree", "-r", "-z", "HEAD", ".")
+        dirty = _git(base_directory, "diff", "--name-only", "-z", "--relative", "HEAD")
+        if tree is None or dirty is None:
+            return
+        dirty = set(dirty.split("\0"))
+        for line in tree.split("\0"):
+            if not line:
+                continue
+            meta, rel = line.split("\t", 1)
+            if rel not in dirty:
+                self._blobs[rel] = meta.split()[2]
+
+    def get_hash(self, rel, file_path: Path):
+        """
+        Returns the md5 hash of file_path, reusing the recorded one if the file did not change.
+        """
+        st = os.stat(file_path)
+        blob = self._blobs.get(rel)
+        with self._lock:
+            self._seen.add(rel)
+            entry = self.files.get(rel)
+            if entry and ((blob and entry.get("blob") == blob) or
+                          (not blob and entry.get("mtime_ns") == st.st_mtime_ns and entry.get("size") == st.st_size)):
+                self.hits += 1
+                return entry["hash"]
+
+        file_hash = load_artifact(file_path).md5
+        with self._lock:
+            self.misses += 1
+            self.files[rel] = {"hash": file_hash, "blob": blob, "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+        return file_hash
+
+    def changed_items(self, base_directory: Path, item_suffixes, since):
+        """
+        Returns the relative paths of the item folders that changed since the given
+        commit, including uncommitted changes and untracked files. Returns None if
+        the commit is not available, e.g. because a shallow checkout does not have
+        it (see RepoMirror.checkout).
+        """
+        if _git(base_directory, "cat-file", "-e", f"{since}^{{commit}}") is None:
+            return None
+        changed = _git(base_directory, "diff", "--name-only", "-z", "--relative", since)
+        untracked = _git(base_directory, "ls-files", "--others", "--exclude-standard", "-z")
+        if changed is None or untracked is None:
+            return None
+
+        folders = set()
+        for rel in (changed + untracked).split("\0"):
+            parts = rel.split("/")
+            for i, part in enumerate(parts[:-1]):
+                if part.rpartition(".")[2] in item_suffixes:
+                    folders.add("/".join(parts[:i + 1]))
+                    break
+        return folders
+
+    def head_commit(self, base_directory: Path):
+        """
+        Returns the commit checked out in base_directory, or None outside a git checkout.
+        """
+        head = _git(base_directory, "rev-parse", "HEAD")
+        return head.strip() if head else None
+
+    def changed_folders(self, base_directory: Path, item_suffixes):
+        """
+        Returns the relative paths of the item folders to read again since the
+        last scan, or None if base_directory has to be scanned in full, e.g. on
+        the first scan or outside a git checkout.
+        """
+        if not self.scanned_commit or self.scanned_prefix != _git(base_directory, "rev-parse", "--show-prefix"):
+            return None
+        changed = self.changed_items(base_directory, item_suffixes, self.scanned_commit)
+        if changed is None:
+            return None
+        return changed | set(self.dirty)
+
+    def record_scan(self, base_directory: Path, items, content_files):
+        """
+        Keeps the scanned items for the next scan, together with the current commit
+        and the item folders with uncommitted changes.
+        """
+        commit = self.head_commit(base_directory)
+        dirty = self.changed_items(base_directory, content_files, "HEAD") if commit else None
+        if dirty is None:
+            self.scanned_commit, self.scanned_prefix, self.items, self.dirty = None, None, {}, []
+            return
+        self.scanned_commit = commit
+        self.scanned_prefix = _git(base_directory, "rev-parse", "--show-prefix")
+        self.dirty = sorted(dirty)
+        self.items = {}
+        for item in items:
+            rel = item['path'].relative_to(base_directory).as_posix()
+            self.items[rel] = {key: value for key, value in item.items() if key != 'path'}
+            content_file = content_files.get(item['type'])
+            if content_file:
+                with self._lock:
+                    # the recorded hash of a reused item stays valid
+                    self._seen.add(f"{rel}/{content_file}")
+
+    def save(self):
+        with self._lock:
+            # drop files that were not part of this scan, e.g. deleted items
+            files = {rel: entry for rel, entry in self.files.items() if rel in self._seen} if self._seen else dict(self.files)
+            entry = {"scanned_commit": self.scanned_commit, "scanned_prefix": self.scanned_prefix,
+                     "items": self.items, "dirty": self.dirty, "files": files}
+        save_json_entry(self.path, self.repo_key, entry)
@@ -0,0 +1,67 @@
+from pathlib import Path
+
+from deployment.store import load_json_file, save_json_entry
+
+LAKEHOUSE_MAPPING_PATH = "temp/lakehouse_mapping.json"
+
+
+class LakehouseMapping:
+    """
+    Maps the ids of the lakehouses of a source workspace to the ids of the
+    lakehouses of a target workspace, persisted for every source/target pair.
+
+    A source lakehouse is joined to the target lakehouse deployed from the
+    same logicalId, otherwise to the target lakehouse with the same display
+    name. Entries of earlier runs are reused as long as both lakehouses still
+    exist under the same name or logicalId, only the others are joined again.
+    """
+    def __init__(self, source_workspace_id, target_workspace_id, path=LAKEHOUSE_MAPPING_PATH):
+        self.source_workspace_id = source_workspace_id
+        self.target_workspace_id = target_workspace_id
+        self.path = Path(path)
+        self.entries = load_json_file(self.path).get(self._key, {})
+        self.reused = 0
+        self.resolved = 0
+
+    @property
+    def _key(self):
+        return f"{self.source_workspace_id}:{self.target_workspace_id}"
+
+    def resolve(self, source_lakehouses, target_lakehouses, git_logical_ids=None, target_logical_ids=None):
+        """
+        Returns the mapping of source lakehouse ids to target lakehouse ids.
+
+        Args:
+            source_lakehouses (list): Lakehouses of the source workspace.
+            target_lakehouses (list): Lakehouses of the target workspace.
+            git_logical_ids (dict): Display name -> logicalId of the lakehouses in the repo,
+                which the source workspace is synced with.
+            target_logical_ids (dict): Target item id -> logicalId it was deployed from.
+        """
+        git_logical_ids = git_logical_ids or {}
+        target_logical_ids = target_logical_ids or {}
+        targets_by_id = {item['id']: item for item in target_lakehouses}
+        targets_by_name = {item.get('displayName'): item for item in target_lakehouses}
+        targets_by_logical_id = {target_logical_ids[item['id']]: item for item in target_lakehouses if item['id'] in target_logical_ids}
+
+        entries = {}
+        self.reused = self.resolved = 0
+        for source in source_lakehouses:
+            name = source.get('displayName')
+            logical_id = git_logical_ids.get(name)
+            entry = self.entries.get(source['id'])
+            if entry and entry['displayName'] == name and entry.get('logicalId') == logical_id:
+                target = targets_by_id.get(entry['target_id'])
+                if target and (target.get('displayName') == name or (logical_id and target_logical_ids.get(target['id']) == logical_id)):
+                    entries[source['id']] = entry
+                    self.reused += 1
+                    continue
+            target = (logical_id and targets_by_logical_id.get(logical_id)) or targets_by_name.get(name)
+            if target:
+                entries[source['id']] = {"target_id": target['id'], "displayName": name, "logicalId": logical_id}
+                self.resolved += 1
+        self.entries = entries
+        return {source_id: entry['target_id'] for source_id, entry in entries.items()}
+
+    def save(self):
+        save_json_entry(self.path, self._key, self.entries, indent=2)
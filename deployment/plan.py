@@ -0,0 +1,184 @@
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+
+from deployment.config import Config, Target
+from deployment.inventory import WorkspaceInventory
+from deployment.journal import DeployJournal, journal_step, plan_fingerprint
+from deployment.manifest import ScanManifest
+from deployment.run import Runner
+
+PLAN_VERSION = 3
+
+
+class PlanError(Exception):
+    """
+    A plan file cannot be applied.
+    """
+
+
+class StalePlanError(PlanError):
+    """
+    A target workspace changed since the plan was computed.
+    """
+
+
+def build_plan(runners):
+    """
+    Returns the computed plans of the given runners as one json serializable dict.
+
+    The git items that are created or updated are included with their content,
+    so the plan can be applied without the repo. Every target records the
+    version of its inventory, which apply compares with the live workspace.
+    The target ids of matched items are part of the diff, the lakehouse mapping
+    is resolved again when the plan is applied.
+    """
+    first = runners[0]
+    needed = set()
+    targets = []
+    for runner in runners:
+        diff = runner.diff
+        for item_type, type_diff in diff.items():
+            needed.update((item_type, name) for name in type_diff['new'] + type_diff['changed'])
+        targets.append({
+            "name": runner.target.name,
+            "workspace_id": runner.target.workspace_id,
+            "max_workers": runner.target.max_workers,
+            "inventory_version": runner.inventory_tgt.version(),
+            "diff": diff,
+        })
+
+    items = []
+    for item in first.items_git:
+        if (item['type'], item['displayName']) not in needed:
+            continue
+        entry = {"type": item['type'], "displayName": item['displayName'], "description": item.get('description', '')}
+        if item.get('logicalId'):
+            entry["logicalId"] = item['logicalId']
+        if item['type'] == 'Notebook':
+            entry["hash"] = item.get('hash')
+            entry["content"] = base64.b64encode(first.read_notebook(item)).decode('utf-8')
+        items.append(entry)
+
+    return {
+        "version": PLAN_VERSION,
+        "created": datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        "repo_remote_url": first.config.repo_remote_url,
+        "commit": first.commit,
+        "source_workspace_id": first.config.source_workspace_id,
+        "source_items": [{"id": item['id'], "type": item.get('type'), "displayName": item.get('displayName')} for item in first.inventory_src.items],
+        "items": items,
+        "targets": targets,
+    }
+
+
+def save_plan(path, runners):
+    """
+    Writes the computed plans of the given runners to a plan file.
+    """
+    plan = build_plan(runners)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(plan, f, indent=2)
+    return plan
+
+
+def load_plan(path):
+    with open(path) as f:
+        plan = json.load(f)
+    if plan.get("version") != PLAN_VERSION:
+        raise PlanError(f"{path} is not a plan file of version {PLAN_VERSION}")
+    return plan
+
+
+def runners_from_plan(config: Config, plan, resume=False):
+    """
+    Creates one runner per target of the plan, ready to run without the repo.
+
+    The source workspace is not listed and the repo is not scanned. Each target
+    workspace is listed once and compared with the inventory version in the plan.
+
+    With resume, a target with a journal of an earlier attempt of this plan is
+    expected to have changed by the journaled steps. Instead of the inventory
+    version, the remaining steps are checked against the live workspace and
+    the finished steps are skipped when the plan runs.
+
+    Raises:
+        StalePlanError: If any target workspace changed since the plan was computed.
+    """
+    if plan['source_workspace_id'] != config.source_workspace_id:
+        raise PlanError(f"the plan was computed for source workspace {plan['source_workspace_id']}, "
+                        f"the config uses {config.source_workspace_id}")
+    inventory_src = WorkspaceInventory(config.client, plan['source_workspace_id']).seed(plan['source_items'])
+    manifest = ScanManifest(plan['repo_remote_url'])
+    targets = [Target(t['name'], t['workspace_id'], t['max_workers']) for t in plan['targets']]
+    with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+        runners = list(pool.map(lambda target: Runner(config, target, plan['items'], manifest, inventory_src), targets))
+
+    stale = []
+    resumable = []
+    for runner, target_plan in zip(runners, plan['targets']):
+        runner.diff = target_plan['diff']
+        runner.plan_is_current = True
+        runner.commit = plan['commit']
+        runner.plan_id = plan_fingerprint(target_plan['diff'], target_plan['inventory_version'], plan['commit'])
+        journal = DeployJournal(runner.target.workspace_id, runner.plan_id)
+        has_journal = journal.load()
+        if resume and has_journal:
+            conflicts = _check_remaining_steps(runner, journal)
+            if conflicts:
+                stale.append(f"{runner.target.name} ({'; '.join(conflicts)})")
+            runner.journal = journal
+        elif runner.inventory_tgt.version() != target_plan['inventory_version']:
+            stale.append(runner.target.name)
+            if has_journal:
+                resumable.append(runner.target.name)
+    if stale:
+        hint = f"; an earlier apply of this plan stopped partway on {', '.join(resumable)}, continue it with --resume" if resumable else ", compute a new plan"
+        raise StalePlanError(f"target {', '.join(stale)} changed since the plan was computed at {plan['created']}{hint}")
+    return runners
+
+
+def _check_remaining_steps(runner, journal):
+    """
+    Checks that the steps the journal does not record as done can still be
+    applied to the live target workspace and returns the conflicts.
+
+    A create that was started but not recorded as done may have finished after
+    the earlier attempt stopped, the item it created is adopted. A rename of an
+    item that already has its new name and a delete of an item that is already
+    gone are done.
+    """
+    conflicts = []
+    inventory = runner.inventory_tgt
+    for item_type, type_diff in runner.diff.items():
+        for name in type_diff['new']:
+            step = journal_step('create', item_type, name)
+            existing = inventory.get(item_type, name)
+            if journal.is_done(step) or existing is None:
+                continue
+            if journal.status(step) == 'started':
+                journal.record(step, 'done', id=existing['id'], adopted=True)
+            else:
+                conflicts.append(f"{item_type} {name} exists")
+        for name in type_diff['changed']:
+            step = journal_step('update', item_type, name)
+            if not journal.is_done(step) and inventory.get_by_id(type_diff['matches'][name]) is None:
+                conflicts.append(f"{item_type} {name} was deleted")
+        for name in type_diff['renamed']:
+            step = journal_step('rename', item_type, name)
+            existing = inventory.get_by_id(type_diff['matches'][name])
+            if journal.is_done(step):
+                continue
+            if existing is None:
+                conflicts.append(f"{item_type} {type_diff['renamed'][name]} was deleted")
+            elif existing.get('displayName') == name:
+                journal.record(step, 'done', id=existing['id'])
+        for name in type_diff['dangling']:
+            step = journal_step('delete', item_type, name)
+            if not journal.is_done(step) and inventory.get(item_type, name) is None:
+                journal.record(step, 'done', id=None, gone=True)
+    return conflicts
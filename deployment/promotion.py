@@ -0,0 +1,81 @@
+import base64
+import hashlib
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from prompt_toolkit import print_formatted_text as print
+
+from deployment.config import Config
+from deployment.fanout import MultiTargetDeployment
+from deployment.inventory import WorkspaceInventory
+from deployment.run import DEPLOYED_ITEM_TYPES, Runner
+from helpers.fabric import FabricError, get_definition_part, get_item_definition
+from helpers.lro import LroTracker
+from helpers.trace import span
+
+
+def fetch_source_items(client, inventory_src: WorkspaceInventory, max_workers=8):
+    """
+    Returns the deployed items of the source workspace in the form of scanned
+    git items, so that a Runner can promote them without a checkout.
+
+    The definitions of all notebooks are fetched through parallel getDefinition
+    calls and kept in memory as the base64 content of notebook-content.py.
+    The logicalId is taken from the .platform part, if the definition has one.
+
+    Raises:
+        FabricError: If the definition of any notebook could not be fetched,
+            since a missing notebook would be deleted from the target.
+    """
+    items = []
+    notebooks = {}
+    for item in inventory_src.items:
+        if item.get('type') not in DEPLOYED_ITEM_TYPES:
+            continue
+        entry = {"type": item['type'], "displayName": item['displayName'], "description": item.get('description', '')}
+        items.append(entry)
+        if item['type'] == 'Notebook':
+            notebooks[item['id']] = entry
+
+    tracker = LroTracker(client, max_workers=max_workers)
+
+    def record(entry, definition):
+        content = get_definition_part(definition, 'notebook-content.py')
+        if content is None:
+            raise FabricError(f"definition of notebook {entry['displayName']} has no notebook-content.py")
+        entry["content"] = base64.b64encode(content).decode('utf-8')
+        entry["hash"] = hashlib.md5(content).hexdigest()
+        platform = get_definition_part(definition, '.platform')
+        logical_id = platform and json.loads(platform).get('config', {}).get('logicalId')
+        if logical_id:
+            entry["logicalId"] = logical_id
+
+    def fetch(item_id):
+        entry = notebooks[item_id]
+        r = get_item_definition(client, inventory_src.workspace_id, item_id, 'fabricGitSource')
+        tracker.submit(f"Definition {entry['displayName']}", r, fetch_result=True,
+                       on_success=lambda definition: record(entry, definition))
+
+    start = time.perf_counter()
+    with span("fetch definitions", notebooks=len(notebooks)):
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            list(pool.map(fetch, notebooks))
+        failed = tracker.wait()
+    if failed:
+        raise FabricError(f"could not fetch {len(failed)} of {len(notebooks)} notebook definitions: {', '.join(op.name for op in failed)}")
+    print(f"...Fetched {len(notebooks)} notebook definitions from the source workspace in {time.perf_counter() - start:.2f}s")
+    return items
+
+
+def create_promotion(config: Config):
+    """
+    Returns a Runner for a single target or a MultiTargetDeployment for several,
+    promoting the items of the source workspace instead of a scanned repo.
+    """
+    inventory_src = WorkspaceInventory(config.client, config.source_workspace_id).load()
+    items = fetch_source_items(config.client, inventory_src, config.max_workers)
+    with ThreadPoolExecutor(max_workers=len(config.targets)) as pool:
+        runners = list(pool.map(lambda target: Runner(config, target, items, inventory_src=inventory_src), config.targets))
+    if len(runners) > 1:
+        return MultiTargetDeployment(config, runners)
+    return runners[0]
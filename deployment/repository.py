@@ -0,0 +1,93 @@
+import hashlib
+import os
+import subprocess
+from pathlib import Path
+
+MIRROR_CACHE_PATH = "temp/mirrors"
+
+
+def git_env():
+    """
+    The environment for git commands: they must fail instead of prompting for
+    credentials, nobody is there to answer.
+    """
+    return {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
+
+
+class GitError(Exception):
+    """
+    A git command failed.
+    """
+
+
+def run_git(*args, cwd=None):
+    """
+    Runs a git command and returns its output.
+
+    Raises:
+        GitError: If git is not installed or the command fails.
+    """
+    try:
+        r = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, env=git_env())
+    except OSError as e:
+        raise GitError(f"Could not run git: {e}") from e
+    if r.returncode != 0:
+        raise GitError(f"git {args[0]} failed: {r.stderr.strip() or r.stdout.strip()}")
+    return r.stdout
+
+
+class RepoMirror:
+    """
+    A bare mirror of the remote repo, kept in cache_path across runs.
+
+    The first run clones the mirror, later runs only fetch what changed. Each
+    deployment then gets a shallow checkout of one ref from the local mirror,
+    sparse so that only the item folders of the deployed types are written.
+    """
+    def __init__(self, remote_url, cache_path=MIRROR_CACHE_PATH):
+        self.remote_url = remote_url
+        key = hashlib.sha1(remote_url.encode()).hexdigest()[:16]
+        self.path = Path(cache_path).resolve() / f"{key}.git"
+
+    def sync(self):
+        """
+        Clones the mirror if it does not exist yet, otherwise fetches from the remote.
+        """
+        if (self.path / "HEAD").is_file():
+            run_git("remote", "set-url", "origin", self.remote_url, cwd=self.path)
+            run_git("fetch", "--prune", "--quiet", "origin", cwd=self.path)
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            run_git("clone", "--mirror", "--quiet", self.remote_url, str(self.path))
+        # lets checkouts fetch a single older commit, e.g. the one of the last scan
+        run_git("config", "uploadpack.allowReachableSHA1InWant", "true", cwd=self.path)
+
+    def checkout(self, dest, ref=None, item_types=(), item_root="", extra_commits=()):
+        """
+        Checks out ref (a branch or tag, by default the default branch of the
+        remote) into dest with a depth of one commit. If item_types is given,
+        only folders named *.<item type> below item_root are written.
+
+        Args:
+            dest (Path): Empty or not yet existing folder for the checkout.
+            ref (str): Branch or tag to check out.
+            item_types (list): Item types to check out, e.g. ['Lakehouse', 'Notebook'].
+            item_root (str): Folder inside the repo that contains the item folders.
+            extra_commits (list): Commits to fetch into the checkout as well, e.g. the
+                one of the last scan to diff against. They come from the local mirror,
+                commits it does not have are left out.
+        """
+        args = ["clone", "--quiet", "--depth", "1", "--no-checkout"]
+        if ref:
+            args += ["--branch", ref]
+        run_git(*args, self.path.as_uri(), str(dest))
+        if item_types:
+            root = "/" + item_root.strip("/") + "/**/" if item_root.strip("/") else ""
+            patterns = [f"{root}*.{item_type}/" for item_type in item_types]
+            run_git("sparse-checkout", "set", "--no-cone", *patterns, cwd=dest)
+        run_git("checkout", "--quiet", cwd=dest)
+        for commit in filter(None, extra_commits):
+            try:
+                run_git("fetch", "--quiet", "--depth", "1", "origin", commit, cwd=dest)
+            except GitError:
+                pass
@@ -1,93 +1,160 @@
-import requests
-import json
 import base64
+import hashlib
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from html import escape
 from pathlib import Path
 from prompt_toolkit import print_formatted_text as print
 from prompt_toolkit import HTML
 
-from deployment.config import Config
-from anytree import Node, RenderTree
-from helpers.fabric import get_lakehouse_id, create_lakehouse, get_lakehouse_id, delete_lakehouse, create_notebook, get_lakehouses, delete_notebook
-from helpers.general import compute_md5_hash
+from deployment.analysis import analyze_notebooks
+from deployment.config import Config, Target
+from deployment.diff import diff_items
+from deployment.executor import Executor
+from deployment.inventory import WorkspaceInventory
+from deployment.journal import DeployJournal, journal_step, plan_fingerprint
+from deployment.manifest import ScanManifest
+from deployment.mapping import LakehouseMapping
+from deployment.scanner import scan_items
+from deployment.state import DeployState
+from deployment.substitution import IdSubstitution
+from helpers.fabric import FabricError, FabricItemNotFoundError, create_lakehouse, delete_lakehouse, create_notebook, delete_notebook, get_item_definition, get_definition_part, rename_item, update_notebook_definition
+from helpers.general import load_artifact
+from helpers.lro import LroTracker
+from helpers.trace import span
+
+# item types the runner deploys, other items in the target workspace are ignored
+DEPLOYED_ITEM_TYPES = ['Lakehouse', 'Notebook']
 
 
 class Runner:
-    def __init__(self, config: Config):
+    def __init__(self, config: Config, target: Target = None, items_git=None, manifest=None, inventory_src=None):
         """
         Connects to the target workspace and obtains the git and workspace items.
+
+        When deploying to several targets, the scanned git items, the scan manifest
+        and the source inventory can be shared between the runners.
         """
         self.config = config
+        self.target = target or config.targets[0]
+        self.executor = None
+        self.lro_trackers = []
         self.plan = None
         self.plan_is_current = False
-        self.items_tgt = None
         self.items_git = None
+        self._git_index = None
         self.diff = None
         self.mapping = {}
-        self.mapping['workspace'] = {self.config.source_workspace_id : self.config.target_workspace_id}
+        self.mapping['workspace'] = {self.config.source_workspace_id : self.target.workspace_id}
         self.mapping['lakehouse'] = {}
         self.lakehouse_mapping_is_current = False
-        self.items_tgt = self._get_items_tgt()
-        self.items_git = self._get_items_git()
+        self.substitution = None
+        self.unmapped_ids = {}
+        self.manifest = manifest or ScanManifest(self.config.repo_remote_url)
+        self.commit = None
+        self.plan_id = None
+        self.journal = None
+        self.dependencies = None
+        self.state = DeployState(self.target.workspace_id)
+        self.inventory_src = inventory_src or WorkspaceInventory(self.config.client, self.config.source_workspace_id)
+        self.inventory_tgt = WorkspaceInventory(self.config.client, self.target.workspace_id, DEPLOYED_ITEM_TYPES)
+        # the workspace listings and the repo scan do not depend on each other
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            inventories = [pool.submit(self.inventory_tgt.load), pool.submit(self.inventory_src.load)]
+            self.items_git = items_git if items_git is not None else self._get_items_git()
+            for inventory in inventories:
+                inventory.result()
         
 
-    def _update_default_lakehouse_mapping(self):
+    def _update_lakehouse_mapping(self):
         """
-        Gets the mapping of z_default_lakehouse ids between the source and the 
-        target workspace, to be substituted in notebook definitions.
+        Maps the ids of all lakehouses of the source workspace to the target
+        workspace, to be substituted in notebook definitions.
 
-        TODO: do this for other lakehouses than just the z_default_lakehouse
+        Both workspaces were listed once when the runner was created, the
+        mapping of earlier runs is reused where both lakehouses are unchanged.
         """
-        src_id = get_lakehouse_id(self.config.user_headers, self.config.source_workspace_id, 'z_default_lakehouse')
-        tgt_id = get_lakehouse_id(self.config.user_headers, self.config.target_workspace_id, 'z_default_lakehouse')
-        self.mapping['lakehouse'] = {src_id : tgt_id}
+        with span("lakehouse mapping", target=self.target.name) as trace:
+            lakehouse_mapping = LakehouseMapping(self.config.source_workspace_id, self.target.workspace_id)
+            git_logical_ids = {item['displayName']: item['logicalId'] for item in self.items_git
+                               if item.get('type') == 'Lakehouse' and item.get('logicalId')}
+            self.mapping['lakehouse'] = lakehouse_mapping.resolve(self.inventory_src.of_type('Lakehouse'), self.inventory_tgt.of_type('Lakehouse'),
+                                                                  git_logical_ids, self.state.get_logical_ids())
+            lakehouse_mapping.save()
+            trace.update(mapped=len(self.mapping['lakehouse']), reused=lakehouse_mapping.reused, resolved=lakehouse_mapping.resolved)
+        # notebooks are bound to the default lakehouse, it has to be mapped
+        default_src_id = self.inventory_src.require('Lakehouse', 'z_default_lakehouse')['id']
+        if default_src_id not in self.mapping['lakehouse']:
+            raise FabricItemNotFoundError(f"z_default_lakehouse of the source workspace has no counterpart in workspace {self.target.workspace_id}")
+        self.substitution = IdSubstitution(self.mapping, [item['id'] for item in self.inventory_src.items])
         self.lakehouse_mapping_is_current = True
+        return len(self.mapping['lakehouse'])
         
-    def _get_items_tgt(self):
+    @property
+    def items_tgt(self):
         """
-        Get a list of items from the target workspace
+        The list of items in the target workspace
         """
-        url = f'https://api.fabric.microsoft.com/v1/workspaces/{self.config.target_workspace_id}/items'
-        r = requests.get(url, headers=self.config.user_headers)
-        return json.loads(r.text).get("value")
+        return self.inventory_tgt.items
     
     def _get_items_git(self):
         """
         Get a list of items from the git repo.
         """
-        base_directory = self.config.repo_local_path
-
-        items = []
-        # lakehouses
-        lakehouse_folders = [folder for folder in base_directory.rglob("*") if folder.is_dir() and folder.name.endswith(".Lakehouse")]    
-
-        for folder in lakehouse_folders:
-            with open(folder / ".platform") as f:
-                data = json.load(f).get('metadata')
-                items.append(data)
-        
-    
-        notebook_folders = [folder for folder in base_directory.rglob("*") if folder.is_dir() and folder.name.endswith(".Notebook")]  
-        for folder in notebook_folders:
-            notebook_hash = compute_md5_hash(folder / "notebook-content.py")
-            with open(folder / ".platform") as f:
-                data = json.load(f).get('metadata')
-                data["hash"] = notebook_hash
-                items.append(data)
-            
+        base_directory = self.config.repo_local_path / self.config.item_root
+        with span("scan repo") as trace:
+            items = scan_items(base_directory, self.target.max_workers, self.manifest)
+            self.manifest.save()
+            self.commit = self.manifest.head_commit(base_directory)
+            trace.update(items=len(items), hashed=self.manifest.misses, reused=self.manifest.hits, unchanged=self.manifest.reused_items)
+        print(f"...Scanned {len(items)} items ({self.manifest.reused_items} unchanged since the last scan, "
+              f"{self.manifest.misses} files hashed, {self.manifest.hits} reused)")
         return items
     
+    def set_items_git(self, items):
+        """
+        Replaces the git items, e.g. after rescanning changed item folders.
+        """
+        self.items_git = items
+        self._git_index = None
+
+    def get_git_item(self, item_type, display_name):
+        """
+        Returns the git item with the given type and display name, or None.
+        """
+        if self._git_index is None:
+            self._git_index = {(item['type'], item['displayName']): item for item in self.items_git}
+        return self._git_index.get((item_type, display_name))
+
     def get_lakehouse_git_definition(self, display_name):
         # TODO: Error here if notebook path is invalid
-        lh = next((item for item in self.items_git if item['type'] == 'Lakehouse' and item['displayName'] == display_name), None)
+        lh = self.get_git_item('Lakehouse', display_name)
         if not lh:
             print(f"Lakehouse {display_name} not found in repository")
             return
         return lh
+
+    def get_notebook_git_definition(self, display_name):
+        nb = self.get_git_item('Notebook', display_name)
+        if not nb:
+            print(f"Notebook {display_name} not found in repository")
+            return
+        return nb
     
-    def compute_plan(self):
-        self.run_source_checks()
-        self.diff = self._get_diff()
+    def compute_plan(self, source_checks=True, only=None):
+        """
+        Compares the git items with the target workspace. With only, a set of
+        (item type, display name), the plan covers just these items, e.g. the
+        items changed in watch mode, and deletes only target items among them.
+        """
+        # the operations of the previous plan are gone, even if this one cannot be computed
+        self.plan_is_current = False
+        self.executor = None
+        self.journal = None
+        if source_checks:
+            self.run_source_checks()
+        self.diff = self._get_diff(only)
+        self.plan_id = plan_fingerprint(self.diff, self.inventory_tgt.version(), self.commit)
         self.plan_is_current = True
         self.lakehouse_mapping_is_current = False
 
@@ -95,109 +162,304 @@ class Runner:
         if not self.plan_is_current:
             print("run plan first")
             return
+        from anytree import Node, RenderTree
+
+        labels = {"new": "New", "changed": "Update", "unchanged": "Unchanged", "dangling": "Delete"}
         node_root = Node("Deployment")
-        node_lh = Node("Lakehouses", parent=node_root)
-        node_lh_new = Node("New", parent=node_lh)
-        node_lh_ignore = Node("Ignore", parent=node_lh)
-        node_lh_delete = Node("Delete", parent=node_lh)
-
-        node_nb = Node("Notebooks", parent=node_root)
-        node_nb_new = Node("New", parent=node_nb)
-        node_nb_update = Node("Update - not supported yet", parent=node_nb)
-        node_nb_delete = Node("Delete - not supported yet", parent=node_nb)
-
-
-        for new_lh in self.diff['lakehouse']['new']:
-            Node(new_lh, parent=node_lh_new)
-        for ignore_lh in self.diff['lakehouse']['ignore']:
-            Node(ignore_lh, parent=node_lh_ignore)
-        for dangling_lh in self.diff['lakehouse']['dangling']:
-            Node(dangling_lh, parent=node_lh_delete)
-
-        for new_nb in self.diff['notebook']['new']:
-            Node(new_nb, parent=node_nb_new)
-        for update_nb in self.diff['notebook']['update']:
-            Node(update_nb, parent=node_nb_update)
-        for dangling_nb in self.diff['notebook']['dangling']:
-            Node(dangling_nb, parent=node_nb_delete)
+        for item_type, type_diff in self.diff.items():
+            node_type = Node(f"{item_type}s", parent=node_root)
+            for cls, label in labels.items():
+                node_cls = Node(label, parent=node_type)
+                for name in sorted(type_diff[cls]):
+                    Node(name, parent=node_cls)
+            node_renamed = Node("Rename", parent=node_type)
+            for name, old_name in sorted(type_diff['renamed'].items()):
+                Node(f"{old_name} -> {name}", parent=node_renamed)
 
         print("\nHere is your deployment tree:\n")
         for pre, fill, node in RenderTree(node_root):
             print(f"{pre}{node.name}")
 
         print("")
+        self.print_unmapped_ids()
 
     def run(self):
+        """
+        Executes the plan. Lakehouses are created and deleted in parallel, the
+        lakehouse mapping is updated once all of them are done and new or changed
+        notebooks are deployed after that. Dangling notebooks are deleted right away.
+        Items matched by logicalId under another name are renamed before items
+        of their type are created.
+        """
         print("")
         if not self.plan_is_current:
             print("run plan first")
             return
-        
-        # create new lakehouses
-        for new_lh in self.diff['lakehouse']['new']:
-            item_definition = self.get_lakehouse_git_definition(new_lh)
-            print(f"...Creating Lakehouse {new_lh}") 
-            create_lakehouse(self.config.user_headers, self.config.target_workspace_id, item_definition)
+
+        self.prepare_execution()
+        self.print_resumed_steps()
+        print(f"...Running {len(self.executor.operations)} operations with {self.target.max_workers} workers")
+        succeeded = self.execute()
+        self.print_run_summary()
+        self.config.client.controller.print_summary()
+
+        if succeeded:
+            print("...All done.")
+        else:
+            print(HTML("<ansired><b>ERROR</b>: deployment finished with errors</ansired>"))
+            self.print_journal()
+        return succeeded
+
+    def execute(self):
+        """
+        Executes the plan without printing and returns True if every operation succeeded.
+        """
+        if self.executor is None:
+            self.prepare_execution()
+        try:
+            succeeded = self.executor.run()
+        finally:
+            self.state.save()
+        if succeeded:
+            self.journal.remove()
+        return succeeded
+
+    def prepare_execution(self):
+        """
+        Turns the plan into a graph of operations. Steps that the journal of a
+        previous attempt of the same plan records as done are left out.
+        """
+        if self.journal is None:
+            self.journal = DeployJournal(self.target.workspace_id, self.plan_id)
+            self.journal.start()
+        executor = Executor(self.target.max_workers)
+        lakehouse_lro = LroTracker(self.config.client)
+        notebook_lro = LroTracker(self.config.client)
+        self.executor = executor
+        self.lro_trackers = [lakehouse_lro, notebook_lro]
 
         # delete dangling lakehouses
-        for del_lh in self.diff['lakehouse']['dangling']:
-            print(f"...Deleting Lakehouse {del_lh}")
-            id = get_lakehouse_id(self.config.user_headers, self.config.target_workspace_id, del_lh)
-            delete_lakehouse(self.config.user_headers, self.config.target_workspace_id, id)
+        lakehouse_delete_ops = []
+        for del_lh in self._pending('delete', 'Lakehouse', 'dangling'):
+            lakehouse_delete_ops.append(executor.add(f"Delete Lakehouse {del_lh}", self.delete_target_lakehouse, del_lh, group="Delete Lakehouse"))
+
+        # rename lakehouses, once a deleted lakehouse no longer holds the name
+        lakehouse_rename_ops = self._add_rename_ops('Lakehouse', lakehouse_delete_ops)
+
+        # create new lakehouses, once a renamed lakehouse no longer holds the name
+        lakehouse_create_ops = []
+        for new_lh in self._pending('create', 'Lakehouse', 'new'):
+            lakehouse_create_ops.append(executor.add(f"Create Lakehouse {new_lh}", self.create_target_lakehouse, new_lh, lakehouse_lro, depends_on=list(lakehouse_rename_ops), group="Create Lakehouse"))
+        # creations accepted before another one failed are still followed to their end
+        lakehouse_wait_op = executor.add("Wait for lakehouse creations", self._wait_for_operations, lakehouse_lro, after=lakehouse_create_ops)
 
         # update the lakehouse mapping
-        self._update_default_lakehouse_mapping()
+        mapping_op = executor.add("Update lakehouse mapping", self._update_lakehouse_mapping, depends_on=[lakehouse_wait_op] + lakehouse_create_ops + lakehouse_delete_ops + lakehouse_rename_ops)
+
+        # delete dangling notebooks
+        notebook_delete_ops = []
+        for del_nb in self._pending('delete', 'Notebook', 'dangling'):
+            notebook_delete_ops.append(executor.add(f"Delete Notebook {del_nb}", self.delete_target_notebook, del_nb, group="Delete Notebook"))
+
+        # rename notebooks, once a deleted notebook no longer holds the name
+        notebook_rename_ops = self._add_rename_ops('Notebook', notebook_delete_ops)
 
         # create new notebooks
-        for new_nb in self.diff['notebook']['new']:
-            print(f"...Creating Notebook {new_nb}")
-            self.create_notebook_from_local_repo(new_nb, self.config.repo_local_path / (new_nb + '.Notebook'))
+        notebook_ops = []
+        for new_nb in self._pending('create', 'Notebook', 'new'):
+            notebook_ops.append(executor.add(f"Create Notebook {new_nb}", self.create_target_notebook, new_nb, notebook_lro, depends_on=[mapping_op] + notebook_rename_ops, group="Create Notebook"))
 
-        # TODO: update existing notebooks
+        # update changed notebooks
+        for update_nb in self._pending('update', 'Notebook', 'changed'):
+            notebook_ops.append(executor.add(f"Update Notebook {update_nb}", self.update_target_notebook, update_nb, notebook_lro, depends_on=[mapping_op], group="Update Notebook"))
+        self._order_notebook_ops(notebook_ops)
+        executor.add("Wait for notebook creations and updates", self._wait_for_operations, notebook_lro, after=notebook_ops)
 
-        # TODO: delete dangling notebooks
-        for del_nb in self.diff['notebook']['dangling']:
-            print(f"...Deleting Notebook {del_nb}")
-            notebook_id = self.get_target_notebook_by_name(del_nb).get('id')
-            delete_notebook(self.config.user_headers, self.config.target_workspace_id, notebook_id)
+    def _add_rename_ops(self, item_type, delete_ops):
+        """
+        Adds an operation per target item of the given type that was matched by
+        logicalId under another display name, renaming it to its name in git.
+        """
+        renamed = self.diff[item_type]['renamed']
+        return [self.executor.add(f"Rename {item_type} {renamed[name]} to {name}", self.rename_target_item, item_type, name,
+                                  depends_on=list(delete_ops), group=f"Rename {item_type}")
+                for name in self._pending('rename', item_type, 'renamed')]
 
-        print("...All done.")
-    
-    def _get_diff(self):
+    def _order_notebook_ops(self, notebook_ops):
         """
-        Get a dict of the differences of the git repo and the target workspace.
+        Submits the create or update of a notebook only after the requests for
+        the notebooks it runs were accepted, if they are deployed by the same
+        plan, according to the dependency graph of the source checks. The
+        long running operations of those requests may still be in progress, and
+        a notebook is not deployed if one of them was rejected.
+        """
+        if self.dependencies is None:
+            return
+        ops = {op.args[0]: op for op in notebook_ops}
+        for name, op in ops.items():
+            for dep_type, dep_name in self.dependencies.dependencies_of('Notebook', name):
+                if dep_type == 'Notebook' and dep_name in ops:
+                    op.depends_on.append(ops[dep_name])
+
+    def _pending(self, action, item_type, diff_class):
+        """
+        Returns the display names of the given diff class whose step is not done yet.
         """
-        diff = {
-            "lakehouse": {"new": None, "ignore": None, "dangling": None},
-            "notebook": {"new": None, "update": None, "dangling": None}
-        }
+        return [name for name in self.diff[item_type][diff_class] if not self.journal.is_done(journal_step(action, item_type, name))]
 
-        # lakehouse
-        lh_names_git = [item.get('displayName') for item in self.items_git if item.get("type") == "Lakehouse"]
-        lh_names_tgt = [item.get('displayName') for item in self.items_tgt if item.get("type") == "Lakehouse"]
-    
-        new_lh_names = list(set(lh_names_git).difference(lh_names_tgt))
-        ignore_lh_names = list(set(lh_names_git).intersection(lh_names_tgt))
-        dangling_lh_names = list(set(lh_names_tgt).difference(lh_names_git))
+    def print_run_summary(self):
+        """
+        Prints the outcome of every operation and of every created or updated item.
+        """
+        self.executor.print_summary()
+        if any(tracker.operations for tracker in self.lro_trackers):
+            print("Deployed items:\n")
+            for tracker in self.lro_trackers:
+                tracker.print_summary()
+            print("")
+        self.print_unmapped_ids()
+
+    def print_resumed_steps(self):
+        done = self.journal.count()
+        if done:
+            print(f"...Resuming: {done} steps finished by a previous attempt are skipped")
+
+    def print_journal(self):
+        """
+        Tells where the finished steps of a failed run are recorded.
+        """
+        print(f"...{self.journal.count()} finished steps are recorded in {self.journal.path}")
 
-        diff['lakehouse']['new'] = new_lh_names
-        diff['lakehouse']['ignore'] = ignore_lh_names
-        diff['lakehouse']['dangling'] = dangling_lh_names
+    def print_unmapped_ids(self):
+        """
+        Warns about notebooks that still reference ids of the source workspace.
+        """
+        for name, ids in sorted(self.unmapped_ids.items()):
+            print(HTML(f"<ansiyellow><b>WARNING</b>: {name} references unmapped source workspace ids {', '.join(sorted(ids))}</ansiyellow>"))
 
-        # notebooks
-        nb_names_git = [item.get('displayName') for item in self.items_git if item.get("type") == "Notebook"]
-        nb_names_tgt = [item.get('displayName') for item in self.items_tgt if item.get("type") == "Notebook"]
+    def _wait_for_operations(self, tracker):
+        """
+        Waits for all operations submitted to the tracker and fails if any of them failed.
+        """
+        failed = tracker.wait()
+        if failed:
+            raise FabricError(f"{len(failed)} of {len(tracker.operations)} operations failed: {', '.join(op.name for op in failed)}")
+        return len(tracker.operations)
 
-        new_nb_names = list(set(nb_names_git).difference(nb_names_tgt))
-        update_nb_names = list(set(nb_names_git).intersection(nb_names_tgt))
-        dangling_nb_names = list(set(nb_names_tgt).difference(nb_names_git))
+    def create_target_lakehouse(self, display_name, tracker):
+        """
+        Starts the creation of a lakehouse from the git repo in the target workspace.
+        """
+        item_definition = self.get_lakehouse_git_definition(display_name)
+        step = journal_step('create', 'Lakehouse', display_name)
+        self.journal.record(step, 'started')
+        r = create_lakehouse(self.config.client, self.target.workspace_id, item_definition)
+        tracker.submit(f"Lakehouse {display_name}", r, fetch_result=True,
+                       on_success=lambda item: self._record_created_item('Lakehouse', item, item_definition.get('logicalId'), step=step))
+        return r.status_code
+
+    def create_target_notebook(self, display_name, tracker):
+        """
+        Starts the creation of a notebook from the git repo in the target workspace.
+        """
+        item_definition = self.get_notebook_git_definition(display_name)
+        nb_content_b64, content_hash = self._encode_notebook(item_definition)
+        step = journal_step('create', 'Notebook', display_name)
+        self.journal.record(step, 'started')
+        r = create_notebook(self.config.client, self.target.workspace_id, display_name, nb_content_b64)
+        tracker.submit(f"Notebook {display_name}", r, fetch_result=True,
+                       on_success=lambda item: self._record_created_item('Notebook', item, item_definition.get('logicalId'), content_hash, step))
+        return r.status_code
+
+    def _record_created_item(self, item_type, item, logical_id=None, content_hash=None, step=None):
+        self.inventory_tgt.add(item and {'type': item_type, **item})
+        if step:
+            self.journal.record(step, 'done', id=item and item.get('id'))
+        if not item:
+            return
+        if logical_id:
+            self.state.set_logical_id(item['id'], logical_id)
+        if content_hash:
+            self.state.set(item['id'], content_hash)
 
-        diff['notebook']['new'] = new_nb_names
-        diff['notebook']['update'] = update_nb_names
-        diff['notebook']['dangling'] = dangling_nb_names
+    def update_target_notebook(self, display_name, tracker):
+        """
+        Starts uploading the definition of a changed notebook to the target workspace.
+        """
+        item_definition = self.get_notebook_git_definition(display_name)
+        # the matched notebook can have another name if it was matched by logicalId
+        notebook_id = self.diff['Notebook']['matches'].get(display_name) or self.get_target_notebook_by_name(display_name).get('id')
+        nb_content_b64, content_hash = self._encode_notebook(item_definition)
+        step = journal_step('update', 'Notebook', display_name)
+        self.journal.record(step, 'started', id=notebook_id)
+        r = update_notebook_definition(self.config.client, self.target.workspace_id, notebook_id, nb_content_b64)
+        tracker.submit(f"Notebook {display_name} (update)", r,
+                       on_success=lambda _: self._record_updated_notebook(notebook_id, content_hash, step))
+        return r.status_code
+
+    def _record_updated_notebook(self, notebook_id, content_hash, step):
+        self.state.set(notebook_id, content_hash)
+        self.journal.record(step, 'done', id=notebook_id)
+
+    def rename_target_item(self, item_type, display_name):
+        """
+        Renames the target item matched by logicalId to its display name in git.
+        """
+        item_id = self.diff[item_type]['matches'][display_name]
+        step = journal_step('rename', item_type, display_name)
+        self.journal.record(step, 'started', id=item_id)
+        r = rename_item(self.config.client, self.target.workspace_id, item_id, display_name)
+        item = self.inventory_tgt.get_by_id(item_id) or {'id': item_id, 'type': item_type}
+        self.inventory_tgt.remove(item_id)
+        self.inventory_tgt.add({**item, 'displayName': display_name})
+        self.journal.record(step, 'done', id=item_id)
+        return r.status_code
+
+    def delete_target_notebook(self, display_name):
+        """
+        Deletes the notebook with the given display name from the target workspace.
+        """
+        notebook_id = self.get_target_notebook_by_name(display_name).get('id')
+        step = journal_step('delete', 'Notebook', display_name)
+        self.journal.record(step, 'started', id=notebook_id)
+        status_code = delete_notebook(self.config.client, self.target.workspace_id, notebook_id)
+        self.inventory_tgt.remove(notebook_id)
+        self.state.remove(notebook_id)
+        self.journal.record(step, 'done', id=notebook_id)
+        return status_code
 
-        return diff
+    def delete_target_lakehouse(self, display_name):
+        """
+        Deletes the lakehouse with the given display name from the target workspace.
+        """
+        id = self.inventory_tgt.require('Lakehouse', display_name)['id']
+        step = journal_step('delete', 'Lakehouse', display_name)
+        self.journal.record(step, 'started', id=id)
+        status_code = delete_lakehouse(self.config.client, self.target.workspace_id, id)
+        self.inventory_tgt.remove(id)
+        self.state.remove(id)
+        self.journal.record(step, 'done', id=id)
+        return status_code
     
+    def _get_diff(self, only=None):
+        """
+        Get a dict of the differences of the git repo and the target workspace.
+        """
+        with span("diff", target=self.target.name):
+            return self._compute_diff(only)
+
+    def _compute_diff(self, only=None):
+        logical_ids = self.state.get_logical_ids()
+        items_git, items_tgt = self.items_git, self.items_tgt
+        if only is not None:
+            items_git = [item for item in items_git if (item['type'], item['displayName']) in only]
+            wanted = {item.get('logicalId') for item in items_git} - {None}
+            items_tgt = [item for item in items_tgt if (item.get('type'), item.get('displayName')) in only or logical_ids.get(item['id']) in wanted]
+        return diff_items(items_git, items_tgt, DEPLOYED_ITEM_TYPES,
+                          deployed_hash=lambda item: self.state.get(item['id']),
+                          logical_ids=logical_ids,
+                          compare={'Notebook': self._split_changed_notebooks})
+
     def run_source_checks(self):
         print("\n...Running source checks.")
         default_lakehouse = next((obj for obj in self.items_git if obj.get("displayName") == "z_default_lakehouse" and obj.get("type") == "Lakehouse"), None)
@@ -205,8 +467,18 @@ class Runner:
             print("ERROR: no z_default_lakehouse in source")
             sys.exit(1)
         print("......TEST: source contains a z_default_lakehouse -> PASSED")
-        
-        # TODO: notebooks should only be connected to lakehouses in their own workspace.
+
+        with span("analyze notebooks") as trace:
+            graph = analyze_notebooks(self.items_git, self.read_notebook, self.config.source_workspace_id,
+                                      self.inventory_src.items, self.target.max_workers)
+            trace.update(notebooks=len(graph.dependencies), dependencies=graph.edge_count(), problems=len(graph.problems))
+        if graph.problems:
+            for problem in graph.problems:
+                print(HTML(f"<ansired><b>ERROR</b>: {escape(problem)}</ansired>"))
+            print(f"......TEST: notebooks only reference items of the source workspace -> FAILED ({len(graph.problems)} problems)")
+            sys.exit(1)
+        print(f"......TEST: notebooks only reference items of the source workspace -> PASSED ({graph.edge_count()} dependencies)")
+        self.dependencies = graph
 
         print("...All source checks passed.")
 
@@ -214,39 +486,122 @@ class Runner:
         """
             Gets the notebook item description in the target workspace by notebook display name
         """
-        target_nbs = [item for item in self.items_tgt if item.get('type') == 'Notebook' and item.get('displayName') == display_name]
-        if len(target_nbs) != 1:
+        target_nb = self.inventory_tgt.get('Notebook', display_name)
+        if not target_nb:
             raise ValueError(f"Error retrieving notebook {display_name} from target workspace items")
-            return
-        else:
-            return target_nbs[0]
+        return target_nb
 
-    def create_notebook_from_local_repo(self, display_name, folder_path: Path):
+    def read_notebook(self, item):
+        """
+        Returns the raw notebook-content.py of a git notebook item. Items loaded
+        from a plan file carry their content, scanned items are read from the repo.
+        """
+        if 'content' in item:
+            return base64.b64decode(item['content'])
+        # read notebook-content file (once per run)
+        return load_artifact(item['path'] / 'notebook-content.py').data
+
+    def render_notebook(self, item):
+        """
+        Returns the notebook content with the source workspace and lakehouse ids
+        replaced by the ids in the target workspace.
+        """
         if not self.lakehouse_mapping_is_current:
-            print("ERROR: update the lakehouse mapping before creating notebooks")
-            return 
-        
-        url = f'https://api.fabric.microsoft.com/v1/workspaces/{self.config.target_workspace_id}/items'
-        # read notebook-content file
-        with open(folder_path / 'notebook-content.py', 'r') as file:
-                nb_content_string = file.read()
-
-        # switch workspace ids
-        for ws_src in self.mapping.get('workspace').keys():
-            ws_tgt = self.mapping.get('workspace').get(ws_src)
-            print(f"......Changing workspace {ws_src} for {ws_tgt}")
-            nb_content_string = nb_content_string.replace(ws_src, ws_tgt)
-
-        # switch lakehouse ids
-        for lh_src in self.mapping.get('lakehouse').keys():
-            lh_tgt = self.mapping.get('lakehouse').get(lh_src)
-            print(f"......Changing lakehouse {lh_src} for {lh_tgt}")
-            nb_content_string = nb_content_string.replace(lh_src, lh_tgt)
-
-        nb_content_bytes = nb_content_string.encode('utf-8')
-        nb_content_b64 = base64.b64encode(nb_content_bytes).decode('utf-8')
-
-        status_code = create_notebook(self.config.user_headers, self.config.target_workspace_id, display_name, nb_content_b64)
+            raise RuntimeError("update the lakehouse mapping before creating notebooks")
         
-        return status_code
-    
+        with span("render notebook", "notebook", notebook=item['displayName']):
+            # universal newlines
+            nb_content_string = self.read_notebook(item).decode('utf-8').replace('\r\n', '\n').replace('\r', '\n')
+
+            # switch workspace and lakehouse ids
+            result = self.substitution.apply(nb_content_string)
+        if result.unmapped:
+            self.unmapped_ids[f"{item['displayName']}.Notebook"] = result.unmapped
+        return result.text
+
+    def _encode_notebook(self, item):
+        """
+        Returns the base64 encoded notebook content for the target workspace and its hash.
+        """
+        nb_content_string = self.render_notebook(item)
+        with span("encode notebook", "notebook", notebook=item['displayName']):
+            nb_content_bytes = nb_content_string.encode('utf-8')
+            nb_content_b64 = base64.b64encode(nb_content_bytes).decode('utf-8')
+            return nb_content_b64, hashlib.md5(nb_content_bytes).hexdigest()
+
+    def create_notebook_from_local_repo(self, display_name, folder_path: Path):
+        nb_content_b64, _ = self._encode_notebook({'type': 'Notebook', 'displayName': display_name, 'path': folder_path})
+        return create_notebook(self.config.client, self.target.workspace_id, display_name, nb_content_b64)
+
+    def _split_changed_notebooks(self, pairs):
+        """
+        Splits the (git item, target item) pairs of notebooks that exist in git and
+        in the target workspace into the ones whose deployed content differs from
+        git and the unchanged ones.
+
+        The deployed hash is taken from the local deploy state if this tool deployed
+        the notebook before, otherwise the definition is downloaded from the target.
+        """
+        has_default_lakehouse = self.inventory_tgt.get('Lakehouse', 'z_default_lakehouse') is not None
+        if not pairs or not has_default_lakehouse:
+            # the final content is not known before the default lakehouse exists in the target
+            return pairs, []
+        self._update_lakehouse_mapping()
+
+        with ThreadPoolExecutor(max_workers=self.target.max_workers) as pool:
+            git_hashes = list(pool.map(lambda pair: compute_content_hash(self.render_notebook(pair[0])), pairs))
+        deployed_hashes = self._get_deployed_hashes([target['id'] for _, target in pairs])
+
+        changed = [pair for pair, git_hash in zip(pairs, git_hashes) if deployed_hashes.get(pair[1]['id']) != git_hash]
+        unchanged = [pair for pair, git_hash in zip(pairs, git_hashes) if deployed_hashes.get(pair[1]['id']) == git_hash]
+        return changed, unchanged
+
+    def _get_deployed_hashes(self, notebook_ids):
+        """
+        Returns a dict of notebook id to the hash of its deployed content. Notebooks
+        whose definition could not be retrieved are left out.
+
+        Downloaded hashes are recorded in the deploy state, so that later plans
+        do not download the same definitions again.
+        """
+        hashes = {}
+        missing = []
+        for notebook_id in notebook_ids:
+            content_hash = self.state.get(notebook_id)
+            if content_hash:
+                hashes[notebook_id] = content_hash
+            else:
+                missing.append(notebook_id)
+        if not missing:
+            return hashes
+
+        print(f"...Retrieving {len(missing)} notebook definitions from the target workspace")
+        tracker = LroTracker(self.config.client)
+
+        def record(notebook_id, definition):
+            content = get_definition_part(definition, 'notebook-content.py')
+            if content is not None:
+                hashes[notebook_id] = hashlib.md5(content).hexdigest()
+                self.state.set(notebook_id, hashes[notebook_id])
+
+        def fetch(notebook_id):
+            try:
+                r = get_item_definition(self.config.client, self.target.workspace_id, notebook_id, 'fabricGitSource')
+            except FabricError:
+                return
+            tracker.submit(f"Definition {notebook_id}", r, fetch_result=True,
+                           on_success=lambda definition: record(notebook_id, definition))
+
+        with ThreadPoolExecutor(max_workers=self.target.max_workers) as pool:
+            list(pool.map(fetch, missing))
+        tracker.wait()
+        # plans that are only printed or written to a file are not executed, which saves the state as well
+        self.state.save()
+        return hashes
+
+
+def compute_content_hash(content_string):
+    """
+    Returns the md5 hash of a (substituted) item content string.
+    """
+    return hashlib.md5(content_string.encode('utf-8')).hexdigest()
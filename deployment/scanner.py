@@ -0,0 +1,93 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from helpers.general import load_artifact
+
+# item folder suffix -> file whose hash identifies the item content (None if not hashed)
+ITEM_CONTENT_FILES = {
+    "Lakehouse": None,
+    "Notebook": "notebook-content.py",
+    "DataPipeline": "pipeline-content.json",
+    "SemanticModel": "definition.pbism",
+    "Report": "definition.pbir",
+    "Environment": None,
+    "Warehouse": None,
+}
+
+
+def register_item_type(item_type, content_file=None):
+    """
+    Makes the scanner and the diff engine aware of another item type. Items
+    without a content file are never considered changed once they exist.
+    """
+    ITEM_CONTENT_FILES[item_type] = content_file
+
+
+def find_item_folders(root: Path):
+    """
+    Walks the directory tree below root once and yields (folder, item_type) for
+    every item folder.
+
+    Hidden folders like .git are skipped and item folders are never descended into.
+    """
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith(".") or not entry.is_dir(follow_symlinks=False):
+                    continue
+                _, dot, suffix = entry.name.rpartition(".")
+                if dot and suffix in ITEM_CONTENT_FILES:
+                    yield Path(entry.path), suffix
+                else:
+                    stack.append(entry.path)
+
+
+def load_item(folder: Path, item_type, root: Path, manifest=None):
+    """
+    Reads the .platform metadata of an item folder and hashes its content file.
+    If a scan manifest is given, hashes of unchanged files are taken from it.
+    """
+    with open(folder / ".platform") as f:
+        platform = json.load(f)
+    data = platform.get('metadata')
+    logical_id = platform.get('config', {}).get('logicalId')
+    if logical_id:
+        data["logicalId"] = logical_id
+    content_file = ITEM_CONTENT_FILES.get(item_type)
+    if content_file and manifest is not None:
+        data["hash"] = manifest.get_hash((folder / content_file).relative_to(root).as_posix(), folder / content_file)
+    elif content_file:
+        data["hash"] = load_artifact(folder / content_file).md5
+    data["path"] = folder
+    return data
+
+
+def scan_items(root: Path, max_workers=8, manifest=None):
+    """
+    Get a list of items below root, reading and hashing the item folders in parallel.
+
+    With a scan manifest of an earlier scan, only the item folders git reports
+    as changed since then are read, the other items are taken from the manifest.
+    """
+    changed = manifest.changed_folders(root, ITEM_CONTENT_FILES) if manifest is not None else None
+    if changed is None:
+        reused = {}
+        folders = sorted(find_item_folders(root))
+        if manifest is not None:
+            manifest.attach(root)
+    else:
+        reused = {rel: item for rel, item in manifest.items.items() if rel not in changed}
+        # removed folders and folders that a full scan skips are left out
+        folders = sorted((root / rel, rel.rpartition(".")[2]) for rel in changed
+                         if (root / rel).is_dir() and not any(part.startswith(".") for part in rel.split("/")))
+        manifest.reused_items = len(reused)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        items = list(pool.map(lambda args: load_item(*args, root, manifest), folders))
+    items += [{**item, "path": root / rel} for rel, item in reused.items()]
+    items.sort(key=lambda item: item["path"])
+    if manifest is not None:
+        manifest.record_scan(root, items, ITEM_CONTENT_FILES)
+    return items
@@ -0,0 +1,47 @@
+import threading
+from pathlib import Path
+
+from deployment.store import load_json_file, save_json_entry
+
+DEPLOY_STATE_PATH = "temp/deploy_state.json"
+
+
+class DeployState:
+    """
+    Remembers the content hash of every item this tool deployed to a workspace
+    and the logicalId of the git item it was created from, both keyed by the
+    item id in that workspace.
+    """
+    def __init__(self, workspace_id, path=DEPLOY_STATE_PATH):
+        self.workspace_id = workspace_id
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        state = load_json_file(self.path).get(workspace_id, {})
+        self.hashes = state.get("hashes", {})
+        self.logical_ids = state.get("logical_ids", {})
+
+    def get(self, item_id):
+        with self._lock:
+            return self.hashes.get(item_id)
+
+    def set(self, item_id, content_hash):
+        with self._lock:
+            self.hashes[item_id] = content_hash
+
+    def get_logical_ids(self):
+        with self._lock:
+            return dict(self.logical_ids)
+
+    def set_logical_id(self, item_id, logical_id):
+        with self._lock:
+            self.logical_ids[item_id] = logical_id
+
+    def remove(self, item_id):
+        with self._lock:
+            self.hashes.pop(item_id, None)
+            self.logical_ids.pop(item_id, None)
+
+    def save(self):
+        with self._lock:
+            state = {"hashes": dict(self.hashes), "logical_ids": dict(self.logical_ids)}
+        save_json_entry(self.path, self.workspace_id, state, indent=2)
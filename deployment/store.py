@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+# several runners can save to the same files at once
+_FILE_LOCK = threading.Lock()
+
+
+def load_json_file(path: Path):
+    """
+    Returns the content of a json file written by save_json_entry, or an empty
+    dict if it does not exist yet.
+    """
+    with _FILE_LOCK:
+        return _read(path)
+
+
+def save_json_entry(path: Path, key, value, indent=None):
+    """
+    Sets one top level entry of a json file shared by several workspaces or
+    repos, keeping the entries written by others.
+
+    The file is written to a temporary file next to it, which then replaces it,
+    so a crash or a concurrent reader never sees a partly written file.
+    """
+    path = Path(path)
+    with _FILE_LOCK:
+        content = _read(path)
+        content[key] = value
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(content, f, indent=indent)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def _read(path):
+    if not path.is_file():
+        return {}
+    with open(path) as f:
+        return json.load(f)
@@ -0,0 +1,77 @@
+import re
+
+GUID_PATTERN = r"[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}"
+# up to this many mapped and source ids, a substring search per id is faster than a GUID scan
+LITERAL_SEARCH_MAX_IDS = 32
+
+
+class SubstitutionResult:
+    def __init__(self, text, replaced, unmapped):
+        self.text = text
+        self.replaced = replaced
+        self.unmapped = unmapped
+
+
+class IdSubstitution:
+    """
+    Replaces source workspace ids with target workspace ids.
+
+    Any id that is a known id in the source workspace but has no mapping is
+    reported as unmapped. There are two ways to find the ids:
+
+    - literal search: every mapped and source id is looked up with a substring
+      search and the ones found are replaced. This is the usual case, a few
+      lakehouses and a small source workspace.
+    - GUID scan: the content is scanned once for GUIDs and every match is looked
+      up in the mapping, so the cost does not grow with the number of ids. Ids
+      that are not GUIDs are compiled into one alternation in front of the GUID
+      pattern.
+
+    Searching, and if found replacing, one id costs roughly 1/15 to 1/40 of a
+    GUID scan of the same content, so the literal search is used up to
+    LITERAL_SEARCH_MAX_IDS ids. The benchmark puts the crossover between 10
+    and 50 ids (see benchmarks/bench_substitution.py).
+    """
+    def __init__(self, mapping, source_ids=()):
+        self.replacements = {}
+        for ids in mapping.values():
+            self.replacements.update(ids)
+        self.source_ids = set(source_ids).difference(self.replacements)
+        other_keys = sorted((key for key in self.replacements if not re.fullmatch(GUID_PATTERN, key)), key=len, reverse=True)
+        alternatives = [re.escape(key) for key in other_keys]
+        alternatives.append(GUID_PATTERN)
+        self._pattern = re.compile("|".join(alternatives))
+        self.literal_search = self._can_search_literally()
+
+    def _can_search_literally(self):
+        if len(self.replacements) + len(self.source_ids) > LITERAL_SEARCH_MAX_IDS:
+            return False
+        # ids are replaced one after the other, none may be part of another id or of a replacement
+        return not any(key in other_key or key in value for key in self.replacements
+                       for other_key, value in self.replacements.items() if other_key != key)
+
+    def apply(self, text):
+        """
+        Returns a SubstitutionResult with the substituted text, the source ids that
+        were replaced and the source workspace ids that have no mapping.
+        """
+        if self.literal_search:
+            replaced = {key for key in self.replacements if key in text}
+            unmapped = {source_id for source_id in self.source_ids if source_id in text}
+            for key in replaced:
+                text = text.replace(key, self.replacements[key])
+            return SubstitutionResult(text, replaced, unmapped)
+
+        replaced = set()
+        unmapped = set()
+
+        def substitute(match):
+            value = match.group(0)
+            if value in self.replacements:
+                replaced.add(value)
+                return self.replacements[value]
+            if value in self.source_ids:
+                unmapped.add(value)
+            return value
+
+        return SubstitutionResult(self._pattern.sub(substitute, text), replaced, unmapped)
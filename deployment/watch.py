@@ -0,0 +1,200 @@
+import os
+import time
+from collections import Counter
+from html import escape
+from pathlib import Path
+from prompt_toolkit import print_formatted_text as print
+from prompt_toolkit import HTML
+
+from deployment.config import Config
+from deployment.inventory import WorkspaceInventory
+from deployment.manifest import ScanManifest
+from deployment.run import DEPLOYED_ITEM_TYPES, Runner
+from deployment.scanner import find_item_folders, load_item
+from helpers.fabric import FabricError
+from helpers.trace import span
+
+PUSH_LABELS = {"new": "Create", "changed": "Update", "renamed": "Rename", "dangling": "Delete"}
+
+
+def snapshot_item_folders(root: Path):
+    """
+    Returns the newest mtime, the number of files and their total size of every
+    deployed item folder below root.
+    """
+    snapshot = {}
+    for folder, item_type in find_item_folders(root):
+        if item_type not in DEPLOYED_ITEM_TYPES:
+            continue
+        newest, count, size = 0, 0, 0
+        for dirpath, _, filenames in os.walk(folder):
+            for name in filenames:
+                try:
+                    st = os.stat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    # deleted while walking, the next snapshot sees it
+                    continue
+                newest = max(newest, st.st_mtime_ns)
+                count += 1
+                size += st.st_size
+        snapshot[folder] = (newest, count, size)
+    return snapshot
+
+
+def describe_steps(steps, limit=5):
+    """
+    Lists a few (label, item type, name) steps by name, more of them as counts,
+    e.g. '20 x Create Notebook'.
+    """
+    if len(steps) <= limit:
+        return ", ".join(" ".join(step) for step in steps)
+    counts = Counter(f"{label} {item_type}" for label, item_type, _ in steps)
+    return ", ".join(f"{count} x {group}" for group, count in counts.items())
+
+
+class FolderWatcher:
+    """
+    Polls the item folders below root for changes.
+
+    Polling needs no extra dependency and a stat() per file is cheap for the
+    size of a workspace repo. Changes are reported once no further change was
+    seen for debounce seconds, so an editor saving several files, or a git
+    checkout, results in one push.
+    """
+    def __init__(self, root: Path, interval, debounce):
+        self.root = root
+        self.interval = interval
+        self.debounce = debounce
+        self._snapshot = snapshot_item_folders(root)
+
+    def wait_for_changes(self):
+        """
+        Blocks until item folders changed and settled. Returns the changed folders
+        and the time of the newest change as a unix timestamp.
+        """
+        changed = set()
+        saved_at = None
+        last_seen = None
+        while True:
+            time.sleep(self.interval)
+            snapshot = snapshot_item_folders(self.root)
+            folders = {folder for folder in snapshot.keys() | self._snapshot.keys() if snapshot.get(folder) != self._snapshot.get(folder)}
+            self._snapshot = snapshot
+            if folders:
+                changed |= folders
+                # deleted folders have no mtime, take the time they were noticed
+                newest = max((snapshot[folder][0] / 1e9 for folder in folders if folder in snapshot), default=time.time())
+                saved_at = max(saved_at or 0, newest)
+                last_seen = time.monotonic()
+            elif changed and time.monotonic() - last_seen >= self.debounce:
+                return changed, saved_at
+
+
+class WatchSession:
+    """
+    Pushes the items changed in the local repo to a dev workspace as they are saved.
+
+    The runner of the session stays alive between pushes: the http session and
+    the token broker of the client, the inventories of both workspaces, the
+    deploy state and the lakehouse mapping are reused. A push rescans only the
+    changed item folders and plans only the items in them.
+    """
+    def __init__(self, config: Config):
+        """
+        Scans the repo and lists the source workspace and the dev workspace, which
+        is the single target of the config.
+        """
+        self.config = config
+        self.root = config.repo_local_path / config.item_root
+        self.watcher = FolderWatcher(self.root, config.watch_interval, config.watch_debounce)
+        # the working copy has its own scan manifest entry, apart from the checkouts of the remote
+        manifest = ScanManifest(f"watch:{self.root.resolve()}")
+        self.runner = Runner(config, config.targets[0], manifest=manifest)
+        # items of failed pushes, retried with the next push
+        self.pending = set()
+
+    def sync(self):
+        """
+        Pushes the items that are new or changed compared to the dev workspace,
+        without deleting anything.
+        """
+        self.runner.run_source_checks()
+        self.push({(item['type'], item['displayName']) for item in self.runner.items_git})
+
+    def run(self):
+        """
+        Watches the repo until interrupted with ctrl-c.
+        """
+        print(f"...Watching {self.root} for changes (ctrl-c to stop)")
+        try:
+            while True:
+                folders, saved_at = self.watcher.wait_for_changes()
+                items = self.rescan(folders)
+                if items:
+                    self.push(items, saved_at)
+        except KeyboardInterrupt:
+            print("...Stopped watching")
+
+    def rescan(self, folders):
+        """
+        Reloads the given item folders and returns the (type, display name) of
+        every item they held before or hold now.
+        """
+        items = {item['path']: item for item in self.runner.items_git}
+        keys = set()
+        for folder in sorted(folders):
+            old = items.get(folder)
+            if not folder.is_dir():
+                items.pop(folder, None)
+            else:
+                try:
+                    items[folder] = load_item(folder, folder.name.rpartition(".")[2], self.root)
+                except (OSError, ValueError) as e:
+                    # e.g. .platform is written right now, the next change picks it up
+                    print(HTML(f"<ansiyellow><b>WARNING</b>: skipped {escape(folder.name)}: {escape(str(e))}</ansiyellow>"))
+                    continue
+                keys.add((items[folder]['type'], items[folder]['displayName']))
+            if old:
+                keys.add((old['type'], old['displayName']))
+        self.runner.set_items_git(list(items.values()))
+        return keys
+
+    def push(self, items, saved_at=None):
+        """
+        Plans and applies the given (type, display name) items and prints the
+        latency of the push.
+        """
+        runner = self.runner
+        items = items | self.pending
+        start = time.perf_counter()
+        with span("push", "watch", items=len(items)):
+            try:
+                runner.compute_plan(source_checks=False, only=items)
+                steps = [(label, item_type, name) for item_type, type_diff in runner.diff.items()
+                         for cls, label in PUSH_LABELS.items() for name in sorted(type_diff[cls])]
+                if not steps:
+                    print("...Nothing to push, the dev workspace is up to date")
+                    self.pending = set()
+                    return True
+                runner.prepare_execution()
+                succeeded = runner.execute()
+            except (FabricError, OSError, ValueError) as e:
+                # e.g. a notebook that is moved or saved half-written while it is rendered
+                print(HTML(f"<ansired><b>ERROR</b>: {escape(str(e))}</ansired>"))
+                succeeded = False
+
+        elapsed = time.perf_counter() - start
+        if succeeded:
+            self.pending = set()
+            latency = f", {time.time() - saved_at:.2f}s after saving" if saved_at else ""
+            print(f"...Pushed {describe_steps(steps)} in {elapsed:.2f}s{latency}")
+            runner.print_unmapped_ids()
+            runner.unmapped_ids = {}
+        else:
+            if runner.executor is not None:
+                runner.print_run_summary()
+            print(HTML("<ansired><b>ERROR</b>: push finished with errors, it is retried with the next change</ansired>"))
+            self.pending = items
+            # the workspace may have been changed by someone else, list it again for the next push
+            runner.inventory_tgt = WorkspaceInventory(self.config.client, runner.target.workspace_id, DEPLOYED_ITEM_TYPES)
+        return succeeded
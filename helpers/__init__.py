@@ -1,2 +1,5 @@
+from .concurrency import *
 from .general import *
-from .fabric import *
\ No newline at end of file
+from .fabric import *
+from .lro import *
+from .trace import *
@@ -0,0 +1,137 @@
+import threading
+import time
+from contextlib import contextmanager
+from prompt_toolkit import print_formatted_text as print
+
+# endpoint classes with their own concurrency budget
+ENDPOINT_CLASSES = ['list', 'create', 'delete', 'lro_poll']
+# responses that mean the api wants fewer requests
+THROTTLE_STATUS_CODES = (429, 503)
+
+
+def classify_request(method, endpoint):
+    """
+    Returns the endpoint class of a request, e.g. 'create' for POST /workspaces/{id}/items.
+    """
+    if method == "GET":
+        return 'lro_poll' if endpoint.startswith("/operations") else 'list'
+    if method == "DELETE":
+        return 'delete'
+    if endpoint.endswith("/getDefinition"):
+        # a read, even though it is a POST
+        return 'list'
+    return 'create'
+
+
+class AdaptiveLimiter:
+    """
+    Limits the number of requests in flight and adapts the limit to the api (AIMD).
+
+    The limit doubles per window of healthy responses until the first throttled
+    response (slow start), afterwards it grows by one per window. A throttled
+    response halves it, at most once per window, and pauses new requests until
+    the Retry-After of the response has passed.
+    """
+    def __init__(self, name, initial=4, minimum=1, maximum=64, decrease=0.5):
+        self.name = name
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.throttled = 0
+        self.decreases = 0
+        self._slow_start = True
+        self._last_decrease = 0.0
+        self._resume_at = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """
+        Waits for a free slot and returns the time it was granted.
+        """
+        with self._cond:
+            while True:
+                pause = self._resume_at - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self.in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            return time.monotonic()
+
+    def release(self, granted_at, throttled=False, retry_after=None):
+        """
+        Frees the slot granted at granted_at and adapts the limit to the outcome.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                now = time.monotonic()
+                # requests that were sent before the last decrease saw the old limit
+                if granted_at >= self._last_decrease:
+                    self.limit = max(float(self.minimum), self.limit * self.decrease)
+                    self._last_decrease = now
+                    self._slow_start = False
+                    self.decreases += 1
+                if retry_after:
+                    self._resume_at = max(self._resume_at, now + retry_after)
+            elif throttled is False:
+                step = 1.0 if self._slow_start else 1.0 / self.limit
+                self.limit = min(float(self.maximum), self.limit + step)
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds a slot for the enclosed request. The block reports the outcome by
+        setting outcome['throttled'] and outcome['retry_after']; if it raises, the
+        limit is left as it is.
+        """
+        granted_at = self.acquire()
+        outcome = {"throttled": None, "retry_after": None}
+        try:
+            yield outcome
+        finally:
+            self.release(granted_at, outcome["throttled"], outcome["retry_after"])
+
+    def stats(self):
+        with self._cond:
+            return {"class": self.name, "limit": int(self.limit), "in_flight": self.in_flight, "peak_in_flight": self.peak_in_flight,
+                    "requests": self.requests, "throttled": self.throttled, "decreases": self.decreases}
+
+
+class ConcurrencyController:
+    """
+    One AdaptiveLimiter per endpoint class, so that throttled creates do not
+    slow down polling and listing.
+    """
+    def __init__(self, initial=4, minimum=1, maximum=64):
+        self.limiters = {name: AdaptiveLimiter(name, initial, minimum, maximum) for name in ENDPOINT_CLASSES}
+
+    def limiter(self, endpoint_class):
+        return self.limiters[endpoint_class]
+
+    def stats(self):
+        """
+        Returns the current limit, the peak number of requests in flight and the
+        request and throttle counts of every endpoint class.
+        """
+        return [limiter.stats() for limiter in self.limiters.values()]
+
+    def print_summary(self):
+        stats = [s for s in self.stats() if s["requests"]]
+        if not stats:
+            return
+        print("Api concurrency:\n")
+        print(f"{'class':<9} {'limit':>6} {'peak':>6} {'requests':>9} {'throttled':>10} {'backoffs':>9}")
+        for s in stats:
+            print(f"{s['class']:<9} {s['limit']:>6} {s['peak_in_flight']:>6} {s['requests']:>9} {s['throttled']:>10} {s['decreases']:>9}")
+        print("")
@@ -1,99 +1,324 @@
-import requests
-import json
-import sys
-from prompt_toolkit import print_formatted_text as print
-from prompt_toolkit import HTML
-    
+import base64
+import email.utils
+import random
+import re
+import threading
+import time
+from urllib.parse import urlparse
+
+from helpers.concurrency import ENDPOINT_CLASSES, THROTTLE_STATUS_CODES, ConcurrencyController, classify_request
+from helpers.trace import span
+
+FABRIC_API_URL = "https://api.fabric.microsoft.com/v1"
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+# ids in request paths, replaced by {id} to group requests by endpoint
+ID_SEGMENT_PATTERN = re.compile(r"/[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}(?=/|$)")
+
+# errors
+
+class FabricError(Exception):
+    """
+    Base class for errors raised by the Fabric api wrapper.
+    """
+
+class FabricHTTPError(FabricError):
+    """
+    Raised when the Fabric api answers with an unexpected status code.
+    """
+    def __init__(self, message, response):
+        self.status_code = response.status_code
+        self.response_text = response.text
+        super().__init__(f"{message} (status {response.status_code}): {response.text}")
+
+class FabricThrottledError(FabricHTTPError):
+    """
+    Raised when a request is still throttled after all retries are used up.
+    """
+
+class FabricItemNotFoundError(FabricError):
+    """
+    Raised when an item cannot be found in a workspace.
+    """
+
+# client
+
+class FabricClient:
+    """
+    Shared session for all calls to the Fabric api.
+
+    auth_header is either a dict of headers or a callable returning the current
+    headers, e.g. TokenBroker.headers.
+
+    Connections are kept alive in a pool so that parallel workers can reuse them.
+    Throttled (429) and server side (5xx) responses are retried, honoring the
+    Retry-After header if the api sends one and using jittered exponential
+    backoff otherwise.
+
+    The number of requests in flight is limited per endpoint class (list,
+    create, delete, lro_poll) by a ConcurrencyController, which raises the limits
+    while responses are healthy and lowers them when the api throttles.
+    """
+    def __init__(self, auth_header, base_url=FABRIC_API_URL, pool_size=8, max_retries=6, backoff_base=1.0, backoff_max=60.0, timeout=120,
+                 controller=None):
+        self.auth_header = auth_header
+        self.controller = controller or ConcurrencyController(maximum=max(pool_size, 1))
+        self.base_url = base_url.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        # requests is imported when the first client is created to keep startup fast
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        # every endpoint class can use up to pool_size connections
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size * len(ENDPOINT_CLASSES))
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self.retries = 0
+
+    def set_auth_header(self, auth_header):
+        self.auth_header = auth_header
+
+    def request(self, method, path, expected=(200,), error_message=None, **kwargs):
+        """
+        Sends a request and retries it on throttling, server errors and dropped connections.
+
+        Args:
+            method (str): The http method.
+            path (str): Either a path relative to the api base url or a full url.
+            expected (tuple): The status codes that count as success.
+            error_message (str): Message for the exception raised on failure.
+
+        Returns:
+            requests.Response: The successful response.
+        """
+        import requests
+
+        url = path if path.startswith("http") else f"{self.base_url}{path}"
+        error_message = error_message or f"{method} {url} failed"
+        endpoint = self.endpoint(url)
+        endpoint_class = classify_request(method, endpoint)
+        limiter = self.controller.limiter(endpoint_class)
+        with span(f"{method} {endpoint}", "request", method=method, endpoint=endpoint, endpoint_class=endpoint_class, retries=0, throttled=0) as trace:
+            for attempt in range(self.max_retries + 1):
+                trace["retries"] = attempt
+                try:
+                    with limiter.slot() as outcome:
+                        headers = self.auth_header() if callable(self.auth_header) else self.auth_header
+                        r = self.session.request(method, url, headers=headers, timeout=self.timeout, **kwargs)
+                        if r.status_code in THROTTLE_STATUS_CODES:
+                            outcome["throttled"] = True
+                            outcome["retry_after"] = parse_retry_after(r.headers.get("Retry-After"))
+                        elif r.status_code < 500:
+                            outcome["throttled"] = False
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == self.max_retries:
+                        raise FabricError(f"{error_message}: {e}") from e
+                    self._sleep(self._backoff(attempt))
+                    continue
+
+                trace["status"] = r.status_code
+                if r.status_code == 429:
+                    trace["throttled"] += 1
+                if r.status_code in expected:
+                    trace["bytes_sent"] = len(r.request.body or b"")
+                    trace["bytes_received"] = len(r.content)
+                    return r
+                if r.status_code not in RETRY_STATUS_CODES:
+                    raise FabricHTTPError(error_message, r)
+                if attempt == self.max_retries:
+                    if r.status_code == 429:
+                        raise FabricThrottledError(error_message, r)
+                    raise FabricHTTPError(error_message, r)
+                self._sleep(self.retry_delay(r, attempt))
+
+    def get(self, path, **kwargs):
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request("POST", path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.request("PATCH", path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request("DELETE", path, **kwargs)
+
+    def endpoint(self, url):
+        """
+        Returns the path of url below the api base url with ids replaced by {id}.
+        """
+        path = urlparse(url).path
+        base_path = urlparse(self.base_url).path
+        if base_path and path.startswith(base_path):
+            path = path[len(base_path):]
+        return ID_SEGMENT_PATTERN.sub("/{id}", path)
+
+    def retry_delay(self, response, attempt):
+        """
+        Returns the number of seconds to wait before retrying the given response.
+        """
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt):
+        # full jitter: a random delay between 0 and the exponential cap
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def _sleep(self, seconds):
+        with self._lock:
+            self.retries += 1
+        time.sleep(seconds)
+
+
+def parse_retry_after(value):
+    """
+    Parses a Retry-After header given either in seconds or as an http date.
+
+    Returns:
+        float: The number of seconds to wait, or None if the header is missing or invalid.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
 # Fabric api wrapper
 
-def get_workspaces(auth_header):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces'
-    r = requests.get(url, headers=auth_header)
-    if r.status_code != 200:
-        print(HTML("<ansired><b>ERROR:</b> .</ansired>"))
-        print(r.text)
-        print(r.status_code)
-        sys.exit(1)
-    values = json.loads(r.text).get("value")
-    return [value.get("id") for value in values]
+def paginate(client, path, params=None, error_message=None):
+    """
+    Yields the values of a Fabric list endpoint, fetching the next page only when
+    the previous one is consumed.
+
+    Args:
+        client (FabricClient): The client used for the requests.
+        path (str): The list endpoint.
+        params (dict): Query parameters of the first request.
+        error_message (str): Message for the exception raised on failure.
+    """
+    params = dict(params or {})
+    while True:
+        body = client.get(path, params=params, error_message=error_message).json()
+        yield from body.get("value", [])
+        token = body.get("continuationToken")
+        if not token:
+            return
+        if body.get("continuationUri"):
+            path, params = body["continuationUri"], {}
+        else:
+            params["continuationToken"] = token
+
+def iter_workspaces(client):
+    return paginate(client, '/workspaces', error_message="could not retrieve workspaces")
+
+def get_workspaces(client):
+    return [value.get("id") for value in iter_workspaces(client)]
+
+def iter_items(client, workspace_id, item_type=None):
+    params = {"type": item_type} if item_type else None
+    return paginate(client, f'/workspaces/{workspace_id}/items', params, error_message=f"could not retrieve items of workspace {workspace_id}")
+
+def get_items(client, workspace_id, item_type=None):
+    return list(iter_items(client, workspace_id, item_type))
 
 # lakehouse
 
-def create_lakehouse(auth_header, workspace_id, item_definition):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/lakehouses'
-    r = requests.post(url, headers=auth_header, data=item_definition)
-    if r.status_code != 201:
-        print(HTML("<ansired><b>ERROR:</b> could not create lakehouse.</ansired>"))
-        print(r.text)
-        print(r.status_code)
-        sys.exit(1)
-    return r.status_code
+def create_lakehouse(client, workspace_id, item_definition):
+    payload = {
+        "displayName": item_definition.get("displayName"),
+        "description": item_definition.get("description", ""),
+    }
+    r = client.post(f'/workspaces/{workspace_id}/lakehouses', json=payload, expected=(201, 202),
+                    error_message=f"could not create lakehouse {payload['displayName']}")
+    return r
 
-def get_lakehouses(auth_header, workspace_id):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/lakehouses'
-    r = requests.get(url, headers=auth_header)
-    if r.status_code != 200:
-        print(HTML(f'<ansired><b>ERROR:</b>Error retrieving lakehouses</ansired>'))
-        sys.exit(1)
-    values = json.loads(r.text).get("value")
-    lhs = [item for item in values if item['type'] == 'Lakehouse']
+def iter_lakehouses(client, workspace_id):
+    return paginate(client, f'/workspaces/{workspace_id}/lakehouses', error_message="could not retrieve lakehouses")
+
+def get_lakehouses(client, workspace_id):
+    lhs = [item for item in iter_lakehouses(client, workspace_id) if item['type'] == 'Lakehouse']
     return lhs
 
-def get_lakehouse_id(auth_header, workspace_id, display_name):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/lakehouses'
-    r = requests.get(url, headers=auth_header)
-    values = json.loads(r.text).get("value")
-    lh = next((item for item in values if item['type'] == 'Lakehouse' and item['displayName'] == display_name), None)
+def get_lakehouse_id(client, workspace_id, display_name):
+    lh = next((item for item in iter_lakehouses(client, workspace_id) if item['displayName'] == display_name), None)
     if not lh:
-        print(HTML(f'<ansired><b>ERROR:</b> No lakehouse with display_name {display_name} found in workspace {workspace_id}</ansired>'))
-        sys.exit(1)
+        raise FabricItemNotFoundError(f"No lakehouse with display_name {display_name} found in workspace {workspace_id}")
     return lh['id']
 
-def delete_lakehouse(auth_header, workspace_id, lakehouse_id):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/lakehouses/{lakehouse_id}'
-    r = requests.delete(url, headers=auth_header)
-    if r.status_code != 201:
-        print(HTML("<ansired><b>ERROR:</b> could not delete lakehouse.</ansired>"))
-        print(r.text)
-        print(r.status_code)
-        sys.exit(1)
+def delete_lakehouse(client, workspace_id, lakehouse_id):
+    r = client.delete(f'/workspaces/{workspace_id}/lakehouses/{lakehouse_id}',
+                      error_message=f"could not delete lakehouse with id {lakehouse_id}")
     return r.status_code
 
+# items
+
+def get_item_definition(client, workspace_id, item_id, format=None):
+    path = f'/workspaces/{workspace_id}/items/{item_id}/getDefinition'
+    if format:
+        path += f'?format={format}'
+    r = client.post(path, expected=(200, 202), error_message=f"could not retrieve definition of item {item_id}")
+    return r
+
+def rename_item(client, workspace_id, item_id, display_name):
+    r = client.patch(f'/workspaces/{workspace_id}/items/{item_id}', json={"displayName": display_name},
+                     error_message=f"could not rename item with id {item_id} to {display_name}")
+    return r
+
+def get_definition_part(definition, part_path):
+    """
+    Returns the decoded payload of one part of an item definition, or None if
+    the definition has no such part.
+    """
+    parts = (definition or {}).get("definition", {}).get("parts", [])
+    part = next((part for part in parts if part.get("path") == part_path), None)
+    if not part:
+        return None
+    return base64.b64decode(part["payload"])
+
 # notebook
 
-def create_notebook(auth_header, workspace_id, display_name, nb_content_b64):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/items'
+def _notebook_definition(nb_content_b64):
+    return {
+        "format": "fabricGitSource",
+        "parts": [
+            {
+                "path": "notebook-content.py",
+                "payload": nb_content_b64,
+                "payloadType": "InlineBase64"
+            }
+        ]
+    }
+
+def create_notebook(client, workspace_id, display_name, nb_content_b64):
     payload = {
         "displayName": display_name,
         "type": "Notebook",
-        "definition": {
-            "format": "fabricGitSource",
-            "parts": [
-                {
-                    "path": "notebook-content.py",
-                    "payload": nb_content_b64,
-                    "payloadType": "InlineBase64"
-                }
-            ]
-        }
+        "definition": _notebook_definition(nb_content_b64)
     }
-    r = requests.post(url, headers=auth_header, json=payload)
-    if r.status_code != 202:
-        print(HTML(f"<ansired><b>ERROR:</b> could not create notebook {display_name}.</ansired>"))
-        print(r.text)
-        print(r.status_code)
-        sys.exit(1)
-    return r.status_code
+    r = client.post(f'/workspaces/{workspace_id}/items', json=payload, expected=(201, 202),
+                    error_message=f"could not create notebook {display_name}")
+    return r
 
+def update_notebook_definition(client, workspace_id, notebook_id, nb_content_b64):
+    payload = {"definition": _notebook_definition(nb_content_b64)}
+    r = client.post(f'/workspaces/{workspace_id}/items/{notebook_id}/updateDefinition', json=payload, expected=(200, 202),
+                    error_message=f"could not update notebook with id {notebook_id}")
+    return r
 
-def delete_notebook(auth_header, workspace_id, notebook_id):
-    url = f'https://api.fabric.microsoft.com/v1/workspaces/{workspace_id}/notebooks/{notebook_id}'
 
-    r = requests.delete(url, headers=auth_header)
-    if r.status_code != 200:
-        print(HTML(f"<ansired><b>ERROR:</b> could not delete notebook with id {notebook_id}.</ansired>"))
-        print(r.text)
-        print(r.status_code)
-        sys.exit(1)
+def delete_notebook(client, workspace_id, notebook_id):
+    r = client.delete(f'/workspaces/{workspace_id}/notebooks/{notebook_id}',
+                      error_message=f"could not delete notebook with id {notebook_id}")
     return r.status_code
-
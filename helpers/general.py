@@ -2,6 +2,8 @@ import base64
 import hashlib
 import os
 import platform
+import threading
+from collections import OrderedDict
 from prompt_toolkit import print_formatted_text as print
 from prompt_toolkit import HTML
 
@@ -14,23 +16,125 @@ def clear_terminal():
     else:
         os.system("clear")  # Unix-based systems (Linux/Mac) command to clear the terminal
 
+# artifacts
+
+# multiple of 3, so that every chunk can be base64 encoded on its own
+ARTIFACT_CHUNK_SIZE = 3 * 256 * 1024
+# upper bound for the file contents kept in memory during a run
+ARTIFACT_CACHE_BYTES = 256 * 1024 * 1024
+
+
+class Artifact:
+    """
+    The md5 hash of a file together with either its raw content (data) or its
+    base64 encoded content (payload).
+    """
+    def __init__(self, path, md5, data=None, payload=None):
+        self.path = path
+        self.md5 = md5
+        self.data = data
+        self.payload = payload
+
+    @property
+    def size(self):
+        return len(self.data if self.data is not None else self.payload)
+
+
+class ArtifactCache:
+    """
+    Least recently used cache of loaded artifacts, bounded by their total size.
+    Entries are invalidated when the mtime or size of the file changes.
+    """
+    def __init__(self, max_bytes=ARTIFACT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, stat):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != (stat.st_mtime_ns, stat.st_size):
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, stat, artifact):
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._bytes -= old[1].size
+            if artifact.size > self.max_bytes:
+                return
+            self._entries[key] = ((stat.st_mtime_ns, stat.st_size), artifact)
+            self._bytes += artifact.size
+            while self._bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+
+_artifact_cache = ArtifactCache()
+
+
+def _read_chunks(file_path):
+    with open(file_path, 'rb') as file:
+        while chunk := file.read(ARTIFACT_CHUNK_SIZE):
+            yield chunk
+
+
+def load_artifact(file_path, encode=False):
+    """
+    Reads a file once in chunks, computing its md5 hash and either keeping the
+    raw content or base64 encoding it on the way. The result is cached until
+    the file changes.
+
+    Args:
+        file_path (str): The path to the file.
+        encode (bool): Keep the base64 encoded content instead of the raw bytes.
+
+    Returns:
+        Artifact: The hash and content of the file.
+
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    key = (str(file_path), encode)
+    stat = os.stat(file_path)
+    artifact = _artifact_cache.get(key, stat)
+    if artifact is not None:
+        return artifact
+
+    md5 = hashlib.md5()
+    parts = []
+    for chunk in _read_chunks(file_path):
+        md5.update(chunk)
+        parts.append(base64.b64encode(chunk) if encode else chunk)
+    content = b''.join(parts)
+    if encode:
+        artifact = Artifact(file_path, md5.hexdigest(), payload=content.decode('ascii'))
+    else:
+        artifact = Artifact(file_path, md5.hexdigest(), data=content)
+    _artifact_cache.put(key, stat, artifact)
+    return artifact
+
+
 def compute_md5_hash(file_path):
     """
-    Compute the MD5 hash of a file.
+    Compute the MD5 hash of a file, reading it in chunks.
 
     Args:
         file_path (str): The path to the file.
 
     Returns:
         str: The MD5 hash as a hexadecimal string.
+
+    Raises:
+        OSError: If the file cannot be read.
     """
-    try:
-        # Read the entire file in binary mode and compute the hash
-        with open(file_path, 'rb') as file:
-            file_data = file.read()
-            return hashlib.md5(file_data).hexdigest()
-    except FileNotFoundError:
-        return f"Error: File '{file_path}' not found."
+    md5 = hashlib.md5()
+    for chunk in _read_chunks(file_path):
+        md5.update(chunk)
+    return md5.hexdigest()
     
 def base64_encode_file(file_path):
     """
@@ -40,22 +144,9 @@ def base64_encode_file(file_path):
         file_path (str): The path to the file to encode.
 
     Returns:
-        str: The Base64-encoded contents of the file, or an error message if the file cannot be read.
-    """
-    try:
-        # Open the file in binary mode and read its contents
-        with open(file_path, 'rb') as file:
-            file_data = file.read()
-        
-        # Base64 encode the binary data
-        encoded_data = base64.b64encode(file_data)
-        
-        # Convert the encoded bytes to a string and return
-        return encoded_data.decode('utf-8')
-    
-    except FileNotFoundError:
-        return f"Error: File '{file_path}' not found."
-    except Exception as e:
-        return f"Error: {e}"
+        str: The Base64-encoded contents of the file.
 
-    
\ No newline at end of file
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    return load_artifact(file_path, encode=True).payload
@@ -0,0 +1,188 @@
+import heapq
+import itertools
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor
+from concurrent.futures import wait as wait_for_futures
+from html import escape
+from prompt_toolkit import print_formatted_text as print
+from prompt_toolkit import HTML
+
+from helpers.fabric import FabricError, parse_retry_after
+
+TERMINAL_STATES = ("Succeeded", "Failed")
+
+
+class LongRunningOperation:
+    """
+    State of a single asynchronous Fabric operation (an api call answered with 202).
+    """
+    def __init__(self, name, location=None, fetch_result=False, on_success=None):
+        self.name = name
+        self.location = location
+        self.fetch_result = fetch_result
+        self.on_success = on_success
+        self.status = "Running"
+        self.error = None
+        self.result = None
+        self.submitted_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATES
+
+    @property
+    def duration(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.submitted_at
+
+    def _finish(self, status, error=None, result=None):
+        self.status = status
+        self.error = error
+        self.result = result
+        self.finished_at = time.monotonic()
+
+
+class LroTracker:
+    """
+    Tracks many long-running operations and polls all of them from one scheduler.
+
+    Requests are submitted without waiting for the server side work to finish.
+    wait() then polls every outstanding operation whenever it is due, using the
+    Retry-After header of the last response to decide when to poll again. Due
+    polls run on up to max_workers threads, the client limits how many of them
+    are actually in flight.
+    """
+    def __init__(self, client, poll_interval=2.0, timeout=1800, max_workers=16):
+        self.client = client
+        self.max_workers = max_workers
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.operations = []
+        self._queue = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def submit(self, name, response, fetch_result=False, on_success=None):
+        """
+        Registers the response of a create/update call.
+
+        A 200/201 response is complete right away, a 202 response is followed
+        through its Location or x-ms-operation-id header.
+
+        Args:
+            name (str): Name of the operation used in the summary.
+            response (requests.Response): Response of the call that started the operation.
+            fetch_result (bool): Whether to download the operation result once it succeeded.
+            on_success (callable): Called with the result (or the final operation
+                state if fetch_result is False) once the operation succeeded.
+        """
+        location = None
+        if response.status_code == 202:
+            location = response.headers.get("Location")
+            operation_id = response.headers.get("x-ms-operation-id")
+            if not location and operation_id:
+                location = f"/operations/{operation_id}"
+
+        op = LongRunningOperation(name, location, fetch_result, on_success)
+        with self._lock:
+            self.operations.append(op)
+        if location:
+            delay = parse_retry_after(response.headers.get("Retry-After"))
+            self._schedule(op, self.poll_interval if delay is None else delay)
+        else:
+            self._succeed(op, _json_or_none(response))
+        return op
+
+    def wait(self):
+        """
+        Polls until every submitted operation succeeded, failed or timed out.
+
+        Returns:
+            list: The operations that did not succeed.
+        """
+        polling = set()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            while True:
+                now = time.monotonic()
+                with self._lock:
+                    due = []
+                    while self._queue and self._queue[0][0] <= now:
+                        due.append(heapq.heappop(self._queue)[2])
+                    next_due = self._queue[0][0] if self._queue else None
+                polling.update(pool.submit(self._poll, op) for op in due)
+                if not polling and next_due is None:
+                    break
+                timeout = None if next_due is None else max(0.0, next_due - time.monotonic())
+                if polling:
+                    # a finished poll may have scheduled an earlier one
+                    done, polling = wait_for_futures(polling, timeout=timeout, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                else:
+                    time.sleep(timeout)
+        return [op for op in self.operations if op.status != "Succeeded"]
+
+    def _schedule(self, op, delay):
+        with self._lock:
+            heapq.heappush(self._queue, (time.monotonic() + delay, next(self._counter), op))
+
+    def _poll(self, op):
+        try:
+            r = self.client.get(op.location, error_message=f"could not poll operation for {op.name}")
+        except FabricError as e:
+            op._finish("Failed", error=str(e))
+            return
+
+        body = _json_or_none(r) or {}
+        status = body.get("status")
+        if status == "Succeeded":
+            result = body
+            if op.fetch_result:
+                try:
+                    result = _json_or_none(self.client.get(f"{op.location}/result", error_message=f"could not retrieve result for {op.name}"))
+                except FabricError as e:
+                    op._finish("Failed", error=str(e))
+                    return
+            self._succeed(op, result)
+        elif status == "Failed":
+            error = body.get("error") or {}
+            op._finish("Failed", error=error.get("message") or str(error) or "operation failed")
+        elif time.monotonic() - op.submitted_at > self.timeout:
+            op._finish("Failed", error=f"operation did not finish within {self.timeout}s")
+        else:
+            delay = parse_retry_after(r.headers.get("Retry-After"))
+            self._schedule(op, self.poll_interval if delay is None else delay)
+
+    def _succeed(self, op, result):
+        try:
+            if op.on_success:
+                op.on_success(result)
+        except Exception as e:
+            op._finish("Failed", error=f"{type(e).__name__}: {e}")
+            return
+        op._finish("Succeeded", result=result)
+
+    def print_summary(self):
+        """
+        Prints the final state of every tracked operation.
+        """
+        for op in self.operations:
+            if op.status == "Succeeded":
+                line = f"<ansigreen>OK     </ansigreen> {escape(op.name)}"
+            else:
+                line = f"<ansired>FAILED </ansired> {escape(op.name)}"
+            if op.duration is not None:
+                line += f" ({op.duration:.2f}s)"
+            if op.error:
+                line += f" - {escape(op.error)}"
+            print(HTML(line))
+
+
+def _json_or_none(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
@@ -0,0 +1,113 @@
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from prompt_toolkit import print_formatted_text as print
+
+TRACE_FORMATS = ['json', 'chrome']
+
+Span = namedtuple("Span", ["name", "category", "group", "start", "duration", "thread_id", "thread_name", "attrs"])
+
+
+class Tracer:
+    """
+    Collects timing spans of a deployment: startup phases, the repo scan, the
+    diff, every Fabric api request and every plan operation.
+
+    Tracing is off by default, a disabled tracer records nothing. Spans with the
+    same category and group are aggregated in the summary, e.g. all requests to
+    one endpoint or all notebook creations.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.spans = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter()
+
+    def enable(self):
+        with self._lock:
+            self.enabled = True
+            self.spans = []
+            self._start = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, category="phase", group=None, **attrs):
+        """
+        Times the enclosed block. Yields the attrs dict, so the block can add
+        details like the status code of a request.
+        """
+        if not self.enabled:
+            yield attrs
+            return
+        start = time.perf_counter()
+        try:
+            yield attrs
+        except BaseException as e:
+            attrs.setdefault("error", type(e).__name__)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            thread = threading.current_thread()
+            with self._lock:
+                self.spans.append(Span(name, category, group or name, start - self._start, duration, thread.ident, thread.name, attrs))
+
+    def summary(self):
+        """
+        Returns one row per category and group with the count, total, mean and
+        max duration and the summed retries, throttled responses and bytes.
+        """
+        rows = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            row = rows.setdefault((s.category, s.group), {"category": s.category, "name": s.group, "count": 0, "total": 0.0, "max": 0.0,
+                                                         "errors": 0, "retries": 0, "throttled": 0, "bytes": 0})
+            row["count"] += 1
+            row["total"] += s.duration
+            row["max"] = max(row["max"], s.duration)
+            row["errors"] += 1 if "error" in s.attrs else 0
+            row["retries"] += s.attrs.get("retries", 0)
+            row["throttled"] += s.attrs.get("throttled", 0)
+            row["bytes"] += s.attrs.get("bytes_sent", 0) + s.attrs.get("bytes_received", 0)
+        for row in rows.values():
+            row["mean"] = row["total"] / row["count"]
+        return sorted(rows.values(), key=lambda row: (row["category"], -row["total"]))
+
+    def print_summary(self):
+        rows = self.summary()
+        width = max([len(row["name"]) for row in rows] + [4])
+        print(f"\nTrace summary ({time.perf_counter() - self._start:.2f}s):\n")
+        print(f"{'category':<10} {'name':<{width}} {'count':>6} {'total s':>8} {'mean ms':>8} {'max ms':>8} {'errors':>6} {'retries':>7} {'429s':>5} {'kB':>8}")
+        for row in rows:
+            print(f"{row['category']:<10} {row['name']:<{width}} {row['count']:>6} {row['total']:>8.2f} {row['mean'] * 1000:>8.1f} "
+                  f"{row['max'] * 1000:>8.1f} {row['errors']:>6} {row['retries']:>7} {row['throttled']:>5} {row['bytes'] / 1024:>8.1f}")
+        print("")
+
+    def export(self, path, trace_format='chrome'):
+        """
+        Writes the spans to path, either as plain json with the summary or in the
+        Chrome trace event format (open with chrome://tracing or Perfetto).
+        """
+        with self._lock:
+            spans = list(self.spans)
+        if trace_format == 'json':
+            data = {"spans": [s._asdict() for s in spans], "summary": self.summary()}
+        elif trace_format == 'chrome':
+            events = [{"name": s.name, "cat": s.category, "ph": "X", "ts": s.start * 1e6, "dur": s.duration * 1e6,
+                       "pid": 1, "tid": s.thread_id, "args": s.attrs} for s in spans]
+            threads = {s.thread_id: s.thread_name for s in spans}
+            events += [{"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": name}} for tid, name in threads.items()]
+            data = {"traceEvents": events, "displayTimeUnit": "ms"}
+        else:
+            raise ValueError(f"unknown trace format {trace_format}, expected one of {', '.join(TRACE_FORMATS)}")
+        with open(path, "w") as f:
+            json.dump(data, f, default=str)
+
+
+# the tracer used by the whole tool
+TRACER = Tracer()
+
+
+def span(name, category="phase", group=None, **attrs):
+    return TRACER.span(name, category, group, **attrs)
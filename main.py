@@ -4,13 +4,24 @@ from prompt_toolkit import HTML
 from prompt_toolkit.shortcuts import yes_no_dialog
 from prompt_toolkit.completion import WordCompleter
 from pathlib import Path
+import argparse
 import tempfile
-import os
+from html import escape
 import sys
 from helpers.general import clear_terminal
+from helpers.fabric import FabricError
+from helpers.trace import TRACE_FORMATS, TRACER
 
-from deployment.config import Config
-from deployment.run import Runner
+from deployment.auth import AuthError
+from deployment.config import Config, Target
+from deployment.bootstrap import bootstrap
+from deployment.fanout import MultiTargetDeployment
+from deployment.manifest import ScanManifest
+from deployment.plan import PlanError, load_plan, runners_from_plan, save_plan
+from deployment.promotion import create_promotion
+from deployment.repository import GitError, RepoMirror
+from deployment.run import DEPLOYED_ITEM_TYPES
+from deployment.watch import WatchSession
 
 class App:
     def __init__(self):
@@ -60,6 +71,31 @@ class App:
             print("Invalid choice.")
             sys.exit(1)
 
+def prepare_deployment(config, repo_path, is_temp=False):
+    """
+    Makes the repository available at repo_path and returns the deployment.
+
+    Args:
+        config: The configuration object for deployment.
+        repo_path: Path to the repository to use for deployment.
+        is_temp: Whether repo_path is a temporary folder to check the remote repo out to.
+    """
+    config.set_repo_local_path(Path(repo_path))
+
+    def clone_repo():
+        mirror = RepoMirror(config.repo_remote_url)
+        print(f"...Updating mirror of {config.repo_remote_url}")
+        mirror.sync()
+        print(f"...Checking out {config.repo_ref or 'default branch'} to temporary directory: {repo_path}")
+        # with the commit of the last scan, the scan only reads the item folders changed since
+        scanned_commit = ScanManifest(config.repo_remote_url).scanned_commit
+        mirror.checkout(Path(repo_path), config.repo_ref, DEPLOYED_ITEM_TYPES, config.item_root, [scanned_commit])
+
+    if not is_temp:
+        print(f"...Using local repo {repo_path}")
+    # the clone runs while signing in
+    return bootstrap(config, clone_repo if is_temp else None)
+
 def deploy_with_repo(config, app, repo_path, is_temp=False):
     """
     Handles the deployment process with the given repository path.
@@ -68,26 +104,110 @@ def deploy_with_repo(config, app, repo_path, is_temp=False):
         config: The configuration object for deployment.
         app: The application object handling user interaction.
         repo_path: Path to the repository to use for deployment.
-        is_temp: Whether the repository path is temporary and needs cleanup.
+        is_temp: Whether repo_path is a temporary folder to check the remote repo out to.
     """
-    config.set_repo_local_path(Path(repo_path))
-    if is_temp:
-        print(f"Cloning repository to temporary directory: {repo_path}")
-        os.system(f"git clone {config.repo_remote_url} {repo_path}")
-    else:
-        print(f"...Using local repo {repo_path}")
-
-    dep = Runner(config)
+    dep = prepare_deployment(config, repo_path, is_temp)
     app._run_or_exit("Run preview deployment? (Type 'yes' or 'no'): ")
     dep.compute_plan()
     dep.print_plan()
     app._run_or_exit("Run deployment? (Type 'yes' or 'no'): ")
-    dep.run()
+    if not dep.run():
+        sys.exit(1)
+
+def plan_with_repo(config, repo_path, plan_file, is_temp=False):
+    """
+    Computes the plan without prompts and writes it to plan_file.
+    """
+    dep = prepare_deployment(config, repo_path, is_temp)
+    dep.compute_plan()
+    dep.print_plan()
+    runners = dep.runners if isinstance(dep, MultiTargetDeployment) else [dep]
+    save_plan(plan_file, runners)
+    print(f"...Plan written to {plan_file}")
+
+def apply_plan(config, plan_file, resume=False):
+    """
+    Applies a plan file without prompts, the repo is neither checked out nor scanned.
+    With resume, the steps an earlier apply of the same plan finished are skipped.
+    """
+    plan = load_plan(plan_file)
+    config.connect()
+    runners = runners_from_plan(config, plan, resume)
+    print(f"...Plan computed at {plan['created']} is current for {len(runners)} target(s)")
+    dep = MultiTargetDeployment(config, runners) if len(runners) > 1 else runners[0]
+    if not dep.run():
+        sys.exit(1)
+
+def promote_workspace(config, dry_run=False):
+    """
+    Deploys the items of the source workspace to the targets without prompts.
+    Nothing is checked out or scanned, the notebook definitions are fetched
+    from the source workspace.
+    """
+    dep = bootstrap(config, create=create_promotion)
+    dep.compute_plan()
+    dep.print_plan()
+    if dry_run:
+        return
+    if not dep.run():
+        sys.exit(1)
+
+def watch_repo(config, repo_path):
+    """
+    Pushes the items changed in the local repo to the dev workspace of the
+    config as they are saved, until stopped with ctrl-c.
+    """
+    if not config.watch_workspace_id:
+        print(HTML("<ansired><b>ERROR</b>: property watch.workspace_id missing from config file</ansired>"))
+        sys.exit(1)
+    config.targets = [Target("watch", config.watch_workspace_id, config.max_workers)]
+    config.set_repo_local_path(Path(repo_path))
+    config.connect()
+    config.validate()
+    session = WatchSession(config)
+    session.sync()
+    session.run()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Deploys fabric items from git to workspaces. Asks interactively if no command is given.")
+    parser.add_argument("--trace", action="store_true", help="print where the time went: startup phases, api requests and plan operations")
+    parser.add_argument("--trace-file", help="write the trace to this file")
+    parser.add_argument("--trace-format", choices=TRACE_FORMATS, default="chrome", help="format of the trace file (default: chrome)")
+    commands = parser.add_subparsers(dest="command")
+    plan_parser = commands.add_parser("plan", help="compute the plan without prompts and write it to a plan file")
+    plan_parser.add_argument("plan_file")
+    plan_parser.add_argument("--repo", help="local repo to plan from instead of checking out repo_remote_url")
+    apply_parser = commands.add_parser("apply", help="apply a plan file without prompts")
+    apply_parser.add_argument("plan_file")
+    apply_parser.add_argument("--resume", action="store_true", help="continue an apply of the same plan that stopped partway")
+    promote_parser = commands.add_parser("promote", help="deploy the items of the source workspace to the targets without prompts or a checkout")
+    promote_parser.add_argument("--dry-run", action="store_true", help="print the plan without running it")
+    watch_parser = commands.add_parser("watch", help="push changes of the local repo to the dev workspace as they are saved")
+    watch_parser.add_argument("--repo", default="temp/repo/fabric-workspace", help="local repo to watch (default: temp/repo/fabric-workspace)")
+    return parser.parse_args()
+
+def run_command(args):
+    if args.command == "plan":
+        config = Config(connect=False)
+        if args.repo:
+            plan_with_repo(config, args.repo, args.plan_file)
+        else:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                plan_with_repo(config, temp_dir, args.plan_file, is_temp=True)
+        return
+    if args.command == "apply":
+        apply_plan(Config(connect=False), args.plan_file, args.resume)
+        return
+    if args.command == "promote":
+        promote_workspace(Config(connect=False), args.dry_run)
+        return
+    if args.command == "watch":
+        watch_repo(Config(connect=False), args.repo)
+        return
 
-def main():
     clear_terminal()
     app = App()
-    config = Config()
+    config = Config(connect=False)
 
     if app.use_local_repo:
         local_repo_path = "temp/repo/fabric-workspace"
@@ -96,5 +216,21 @@ def main():
         with tempfile.TemporaryDirectory() as temp_dir:
             deploy_with_repo(config, app, temp_dir, is_temp=True)
 
+def main():
+    args = parse_args()
+    if args.trace or args.trace_file:
+        TRACER.enable()
+    try:
+        run_command(args)
+    except (AuthError, FabricError, GitError, PlanError) as e:
+        print(HTML(f"<ansired><b>ERROR</b>: {escape(str(e))}</ansired>"))
+        sys.exit(1)
+    finally:
+        if args.trace:
+            TRACER.print_summary()
+        if args.trace_file:
+            TRACER.export(args.trace_file, args.trace_format)
+            print(f"...Trace written to {args.trace_file}")
+
 if __name__ == '__main__':
     main()
\ No newline at end of file